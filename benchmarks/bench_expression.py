@@ -0,0 +1,52 @@
+"""
+Compare rio-tiler's `ImageData.apply_expression` with `cogserver.expression.CompiledExpression`.
+
+    python benchmarks/bench_expression.py [--size 512] [--repeat 200]
+"""
+import argparse
+import sys
+import timeit
+
+import numpy
+from rio_tiler.models import ImageData
+
+sys.path.insert(0, "src")
+from cogserver.expression import compile_expression  # noqa: E402
+
+EXPRESSIONS = [
+    "b1/b2",
+    "(b1-b2)/(b1+b2)",
+    "((b1>0.5)&(b3<100))/b4",
+    "where(b4>0, (b1-b2)/(b1+b2), 0);b3*2;b1+b2+b3+b4",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--dtype", default="float32")
+    opts = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    data = numpy.ma.MaskedArray((rng.random((4, opts.size, opts.size)) * 200).astype(opts.dtype))
+    data.mask = rng.random(data.shape) > 0.9
+    img = ImageData(data, band_names=["b1", "b2", "b3", "b4"])
+
+    print(f"{'expression':<50} {'rio-tiler ms':>13} {'compiled ms':>12} {'speedup':>8}")
+    for expression in EXPRESSIONS:
+        expected = img.apply_expression(expression)
+        actual = compile_expression(expression).apply(img)
+        assert numpy.array_equal(expected.array.data, actual.array.data)
+        assert numpy.array_equal(expected.array.mask, actual.array.mask)
+
+        baseline = min(timeit.repeat(lambda: img.apply_expression(expression), number=opts.repeat, repeat=3))
+        compiled = min(timeit.repeat(lambda: compile_expression(expression).apply(img), number=opts.repeat, repeat=3))
+        print(
+            f"{expression:<50} {baseline / opts.repeat * 1000:>13.3f} {compiled / opts.repeat * 1000:>12.3f} "
+            f"{baseline / compiled:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare the time and the output of the algorithms run on low zoom tiles read at the tile resolution
+and read from coarser overviews (`cogserver.overview`), then upsampled for display.
+
+A synthetic 4 bands COG (two smooth radiance bands and two cloud masks) with overviews is written first,
+then every tile of every zoom up to ALGORITHM_OVERVIEW_MAX_ZOOM overlapping its center area is rendered both ways.
+The accuracy is the share of the valid pixels classified the same (flood_detection) or the mean absolute
+difference of the output (rca, in %), over the pixels valid in both outputs.
+
+    python benchmarks/bench_overview_algorithms.py [--size 4096] [--tiles 4] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+sys.path.insert(0, "src")
+
+
+def make_dataset(path: str, size: int):
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds
+    from rio_tiler.utils import resize_array
+
+    rng = numpy.random.default_rng(0)
+
+    def smooth(scale: int, low: float, high: float):
+        coarse = rng.random((1, size // scale, size // scale), dtype="float32")
+        fine = resize_array(coarse, size, size, "bilinear")[0]
+        fine += rng.normal(0, 0.03, (size, size)).astype("float32")
+        return (low + (high - low) * fine.clip(0, 1)).astype("uint16")
+
+    before = smooth(64, 100, 4000)
+    after = (before * rng.uniform(0.7, 1.3, (1,)) + smooth(128, -600, 600)).clip(1, 65535).astype("uint16")
+    clouds = [(smooth(256, 0, 6) * (rng.random((size, size)) < 0.9)).astype("uint16") for _ in range(2)]
+
+    # ~1.6 km pixels, between the zoom 6 and 7 tile resolutions
+    bounds = (-3339584.7, -3339584.7, 3339584.7, 3339584.7)
+    profile = dict(
+        driver="GTiff", width=size, height=size, count=4, dtype="uint16", crs="EPSG:3857",
+        transform=from_bounds(*bounds, size, size), tiled=True, blockxsize=512, blockysize=512,
+        compress="deflate", nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(numpy.stack([before, after] + clouds))
+        dst.build_overviews([2, 4, 8, 16, 32, 64], Resampling.average)
+
+
+def tiles(src, zoom: int, count: int):
+    """Up to `count` x `count` tiles of the dataset at zoom, around its center"""
+    import morecantile
+
+    west, south, east, north = src.get_geographic_bounds(src.tms.rasterio_geographic_crs)
+    center = src.tms.tile((west + east) / 2, (south + north) / 2, zoom)
+    for x in range(center.x - count // 2, center.x - count // 2 + count):
+        for y in range(center.y - count // 2, center.y - count // 2 + count):
+            if 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom and src.tile_exists(x, y, zoom):
+                yield morecantile.Tile(x, y, zoom)
+
+
+def accuracy(name: str, full, fast) -> float:
+    valid = ~full.array.mask[0] & ~fast.array.mask[0]
+    if not valid.any():
+        return float("nan")
+    a = full.array.data[0][valid].astype("float64")
+    b = fast.array.data[0][valid].astype("float64")
+    if name == "flood_detection":
+        return float((a == b).mean() * 100)
+    return float(numpy.abs(a - b).mean())
+
+
+def run(path: str, name: str, count: int, repeat: int):
+    from cogserver.algorithms import algorithms
+    from cogserver.overview import ALGORITHM_OVERVIEW_MAX_ZOOM, downsample_factor, upsampled
+    from cogserver.reader import CogReader
+
+    algorithm = algorithms.get(name)()
+    metric = "agreement %" if name == "flood_detection" else "mean abs diff %"
+    print(f"\n{name}")
+    print(f"{'zoom':>4} {'tiles':>6} {'factor':>6} {'full ms':>9} {'overview ms':>12} {'speedup':>8} {metric:>16}")
+    with CogReader(path) as src:
+        for zoom in range(max(src.minzoom, 0), ALGORITHM_OVERVIEW_MAX_ZOOM + 1):
+            factor = downsample_factor(algorithm, zoom)
+            fast_process = upsampled(algorithm, 256)
+            full_time = fast_time = 0.0
+            scores = []
+            tile_list = list(tiles(src, zoom, count))
+            for tile in tile_list:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    full = algorithm(src.tile(*tile))
+                    full_time += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    fast = fast_process(src.tile(*tile, downsample=factor))
+                    fast_time += time.perf_counter() - start
+                scores.append(accuracy(name, full, fast))
+            n = len(tile_list) * repeat
+            if not n:
+                continue
+            print(
+                f"{zoom:>4} {len(tile_list):>6} {factor:>6} {full_time / n * 1000:>9.1f} {fast_time / n * 1000:>12.1f} "
+                f"{full_time / fast_time:>7.1f}x {numpy.nanmean(scores):>16.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--tiles", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.tif")
+        make_dataset(path, opts.size)
+        for name in ["rca", "flood_detection"]:
+            run(path, name, opts.tiles, opts.repeat)
+
+
+if __name__ == "__main__":
+    main()
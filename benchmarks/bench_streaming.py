@@ -0,0 +1,124 @@
+"""
+Compare the time to first byte and the peak RSS of a MosaicJSON response serialized at once
+(`JSONResponse`, as returned by `/mosaicjson/build` before) and streamed with `cogserver.streaming`.
+
+Every mode runs in its own process so the peak RSS of one does not hide the other.
+
+    python benchmarks/bench_streaming.py [--quadkeys 20000] [--assets 4]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+import zlib
+
+sys.path.insert(0, "src")
+
+MODES = ["jsonresponse", "stream-identity", "stream-gzip", "stream-br", "cached-gzip"]
+
+
+def make_mosaic(quadkeys: int, assets: int):
+    from cogeo_mosaic.mosaic import MosaicJSON
+
+    tiles = {}
+    zoom = 1
+    while 4 ** zoom < quadkeys:
+        zoom += 1
+    for i in range(quadkeys):
+        quadkey = "".join(str((i >> (2 * z)) & 3) for z in reversed(range(zoom)))
+        tiles[quadkey] = [
+            f"https://undpgeohub.blob.core.windows.net/dataset/{i % 997}/{a}/cog_{i}_{a}.tif" for a in range(assets)
+        ]
+    return MosaicJSON(mosaicjson="0.0.3", minzoom=0, maxzoom=zoom, quadkey_zoom=zoom, tiles=tiles)
+
+
+class FakeRequest:
+    def __init__(self, encoding: str):
+        self.headers = {"accept-encoding": encoding}
+
+
+async def consume(response):
+    """Send the response to a fake ASGI server: (seconds to the first body byte, body size)"""
+    start = time.perf_counter()
+    first = None
+    size = 0
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal first, size
+        if message["type"] == "http.response.body" and message.get("body"):
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(message["body"])
+
+    await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    return first, size
+
+
+def run(mode: str, quadkeys: int, assets: int):
+    from titiler.core.resources.responses import JSONResponse
+
+    from cogserver import streaming
+
+    mosaic = make_mosaic(quadkeys, assets)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    if mode == "jsonresponse":
+        response = JSONResponse(mosaic.model_dump(mode="json", exclude_none=True))
+    elif mode == "cached-gzip":
+        raw = "".join(streaming.iter_mosaicjson(mosaic)).encode()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        streaming.response_cache.put("key", "application/json", "gzip", compressor.compress(raw) + compressor.flush())
+        del raw
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        response = streaming.cached_response(FakeRequest("gzip"), "key")
+    else:
+        encoding = mode.split("-")[1]
+        if encoding not in streaming.ENCODINGS + ["identity"]:
+            raise SystemExit(f"{encoding} encoding is not available (brotli is not installed)")
+        response = streaming.streaming_response(
+            FakeRequest(encoding), streaming.iter_mosaicjson(mosaic), "application/json", key="key"
+        )
+    setup = time.perf_counter() - start
+    first, size = asyncio.run(consume(response))
+    total = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    print(json.dumps({
+        "mode": mode, "ttfb_ms": round((setup + first) * 1000, 1), "total_ms": round(total * 1000, 1),
+        "bytes": size, "peak_rss_increase_mb": round(peak / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quadkeys", type=int, default=20000)
+    parser.add_argument("--assets", type=int, default=4)
+    parser.add_argument("--mode", choices=MODES)
+    opts = parser.parse_args()
+
+    if opts.mode:
+        return run(opts.mode, opts.quadkeys, opts.assets)
+
+    print(f"{opts.quadkeys} quadkeys, {opts.assets} assets per quadkey")
+    print(f"{'mode':<16} {'TTFB ms':>9} {'total ms':>9} {'bytes':>11} {'peak RSS +MB':>13}")
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--quadkeys", str(opts.quadkeys), "--assets", str(opts.assets)],
+            capture_output=True, text=True,
+        )
+        if out.returncode:
+            print(f"{mode:<16} skipped: {out.stderr.strip().splitlines()[-1]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:<16} {r['ttfb_ms']:>9} {r['total_ms']:>9} {r['bytes']:>11} {r['peak_rss_increase_mb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,28 @@
 from titiler.core.algorithm import Algorithms, algorithms as default_algorithms
 from .rca import RapidChangeAssessment
 from .flood_detection import DetectFlood
+from .morphology import BinaryCleanup
+from .mask import MaskValues
+from .pipeline import Pipeline, named_pipeline
 
 algorithms: Algorithms = default_algorithms.register(
     {
         "rca": RapidChangeAssessment,
         "flood_detection": DetectFlood,
+        "binary_cleanup": BinaryCleanup,
+        "mask": MaskValues,
+        "pipeline": Pipeline,
+    }
+)
+
+# pipelines registered by name, their steps are validated when they are created (per request)
+algorithms = algorithms.register(
+    {
+        "flood_extent": named_pipeline(
+            "flood_extent",
+            [{"name": "flood_detection"}, {"name": "binary_cleanup", "params": {"min_size": 16}}],
+            title="Flood extent",
+            description="Flood detection without the isolated pixels and small holes",
+        ),
     }
 )
@@ -23,9 +23,10 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from typing import List, Sequence
+from typing import List, Optional, Sequence
 
 import numpy as np
+from pydantic import Field
 from titiler.core.algorithm import BaseAlgorithm
 from rio_tiler.models import ImageData
 from skimage.filters import threshold_otsu
@@ -40,6 +41,12 @@ class DetectFlood(BaseAlgorithm):
     and apply Otsu thresholding algorithm to identify surface water.
     """
 
+    threshold: Optional[float] = Field(
+        default=None, ge=-1, le=1,
+        title="MNDWI threshold",
+        description="Pixels with a MNDWI above this threshold are water. Defaults to the Otsu threshold of the image"
+    )
+
     input_bands: List = [
         {'title': 'Green band', 'description': 'The green band with the wavelength between 0.53µm - 0.59µm',
          'required': True,
@@ -52,13 +59,18 @@ class DetectFlood(BaseAlgorithm):
 
     # Metadata
     input_nbands: int = 2
+    # the Otsu threshold of a tile barely moves on up to 8x coarser overviews
+    input_max_downsample: int = 8
     output_nbands: int = 1
     output_min: Sequence[int] = [-1]
     output_max: Sequence[int] = [1]
     output_colormap_name: str = 'viridis'
+    # binary classes, not interpolated
+    output_resampling: str = 'nearest'
     output_description: str = "The output is a binary image where 1 represents water and 0 represents non-water"
 
-    def __call__(self, img: ImageData, *args, **kwargs):
+    @staticmethod
+    def mndwi(img: ImageData) -> np.ndarray:
         # Extract bands of interest
         green_band = img.data[0].astype("float32")
         swir_band = img.data[1].astype("float32")
@@ -67,10 +79,20 @@ class DetectFlood(BaseAlgorithm):
         numerator = (green_band - swir_band)
         denominator = (green_band + swir_band)
         # Use np.divide to avoid divide by zero errors
-        mndwi_arr = np.divide(numerator, denominator, np.zeros_like(numerator), where=denominator != 0)
+        return np.divide(numerator, denominator, np.zeros_like(numerator), where=denominator != 0)
+
+    def fit(self, img: ImageData) -> "DetectFlood":
+        """Copy of the algorithm using the Otsu threshold of the valid pixels of `img` (e.g. a whole dataset preview)"""
+        mndwi_arr = self.mndwi(img)[~np.ma.getmaskarray(img.array)[:2].any(axis=0)]
+        if mndwi_arr.size == 0 or self.threshold is not None:
+            return self
+        return self.model_copy(update={"threshold": float(threshold_otsu(mndwi_arr))})
+
+    def __call__(self, img: ImageData, *args, **kwargs):
+        mndwi_arr = self.mndwi(img)
 
-        # Apply Otsu thresholding method
-        otsu_threshold = threshold_otsu(mndwi_arr)
+        # Apply Otsu thresholding method, unless the threshold is fixed (dataset wide)
+        otsu_threshold = self.threshold if self.threshold is not None else threshold_otsu(mndwi_arr)
 
         # Use Otsu threshold to classify the computed MNDWI
         classified_arr = mndwi_arr >= otsu_threshold
@@ -0,0 +1,56 @@
+from typing import List, Optional
+
+import numpy
+from pydantic import Field
+from rio_tiler.models import ImageData
+from titiler.core.algorithm.base import BaseAlgorithm
+
+
+class MaskValues(BaseAlgorithm):
+    title: str = "Mask"
+    description: str = "Mask the pixels where the first band has some values or is out of a range"
+
+    values: List[float] = Field(
+        default=[],
+        title="Values",
+        description="Values of the first band to mask"
+    )
+    below: Optional[float] = Field(
+        default=None,
+        title="Below",
+        description="Mask the pixels where the first band is lower than this value"
+    )
+    above: Optional[float] = Field(
+        default=None,
+        title="Above",
+        description="Mask the pixels where the first band is greater than this value"
+    )
+
+    input_description: str = "The first band selects the masked pixels, all the bands are masked"
+    # per pixel
+    input_max_downsample: int = 8
+    output_description: str = "The bands with the selected pixels masked"
+
+    def apply(self, array: numpy.ma.MaskedArray) -> numpy.ma.MaskedArray:
+        """Mask the selected pixels in all the bands, in place (the data is not copied)"""
+        band = array.data[0]
+        selected = numpy.isin(band, self.values) if self.values else numpy.zeros(band.shape, dtype="bool")
+        if self.below is not None:
+            selected |= band < self.below
+        if self.above is not None:
+            selected |= band > self.above
+        if array.mask is numpy.ma.nomask:
+            array.mask = numpy.broadcast_to(selected, array.shape)
+        else:
+            array.mask |= selected
+        return array
+
+    def __call__(self, img: ImageData) -> ImageData:
+        return ImageData(
+            self.apply(img.array.copy()),
+            assets=img.assets,
+            crs=img.crs,
+            bounds=img.bounds,
+            band_names=img.band_names,
+            dataset_statistics=img.dataset_statistics,
+        )
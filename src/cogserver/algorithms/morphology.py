@@ -0,0 +1,66 @@
+from typing import List, Sequence
+
+import numpy
+from pydantic import Field
+from rio_tiler.models import ImageData
+from scipy import ndimage
+from titiler.core.algorithm.base import BaseAlgorithm
+
+
+def remove_small_regions(binary: numpy.ndarray, min_size: int) -> numpy.ndarray:
+    """Binary image without its 8-connected regions of less than `min_size` pixels"""
+    labels, _ = ndimage.label(binary, structure=numpy.ones((3, 3)))
+    sizes = numpy.bincount(labels.ravel())
+    keep = sizes >= min_size
+    keep[0] = False
+    return keep[labels]
+
+
+class BinaryCleanup(BaseAlgorithm):
+    title: str = "Binary cleanup"
+    description: str = "Remove the small isolated regions and fill the small holes of a binary classification (e.g. flood detection)"
+
+    min_size: int = Field(
+        default=16, ge=0, le=10000,
+        title="Minimum region size",
+        unit="pixels",
+        description="Regions (and holes) smaller than this number of pixels are removed (filled)"
+    )
+    fill_holes: bool = Field(
+        default=True,
+        title="Fill holes",
+        description="Also fill the holes smaller than the minimum region size"
+    )
+
+    input_description: str = "A binary classification, non zero values are the class"
+    input_bands: List = [
+        {'title': 'Classification', 'description': 'The binary classification to clean', 'required': True,
+         'keywords': ['classification']},
+    ]
+    input_nbands: int = 1
+    # the region sizes are counted in pixels of the read, coarser reads remove larger regions
+    input_max_downsample: int = 8
+    output_nbands: int = 1
+    output_min: Sequence[int] = [0]
+    output_max: Sequence[int] = [1]
+    output_description: str = "The cleaned binary classification"
+    output_resampling: str = 'nearest'
+
+    def apply(self, array: numpy.ma.MaskedArray) -> numpy.ma.MaskedArray:
+        """Clean the first band of the array, in place"""
+        binary = (array.data[0] != 0) & ~numpy.ma.getmaskarray(array)[0]
+        if self.min_size > 1:
+            binary = remove_small_regions(binary, self.min_size)
+            if self.fill_holes:
+                binary = ~remove_small_regions(~binary, self.min_size)
+        array.data[0] = binary
+        return array
+
+    def __call__(self, img: ImageData) -> ImageData:
+        return ImageData(
+            self.apply(img.array[:1].copy()),
+            assets=img.assets,
+            crs=img.crs,
+            bounds=img.bounds,
+            band_names=img.band_names[:1],
+        )
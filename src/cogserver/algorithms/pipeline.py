@@ -0,0 +1,159 @@
+from typing import Any, Dict, List, Optional, Type
+
+import numpy
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, create_model, model_validator
+from rio_tiler.models import ImageData
+from titiler.core.algorithm.base import BaseAlgorithm
+
+
+class PipelineStep(BaseModel):
+    name: str = Field(title="Algorithm", description="Name of a registered algorithm")
+    params: Dict[str, Any] = Field(default={}, title="Parameters", description="Parameters of the algorithm")
+
+
+def with_array(img: ImageData, array: numpy.ma.MaskedArray) -> ImageData:
+    """ImageData of `img` holding `array` (not copied), the band metadata kept when the bands are the same"""
+    same_bands = array.shape[0] == img.count
+    return ImageData(
+        array,
+        assets=img.assets,
+        crs=img.crs,
+        bounds=img.bounds,
+        band_names=img.band_names if same_bands else None,
+        metadata=img.metadata,
+        dataset_statistics=img.dataset_statistics if same_bands else None,
+    )
+
+
+def first_bands(img: ImageData, count: int) -> ImageData:
+    """The first `count` bands of an ImageData, as views of its data and mask"""
+    return ImageData(
+        img.array[:count],
+        assets=img.assets,
+        crs=img.crs,
+        bounds=img.bounds,
+        band_names=img.band_names[:count],
+        metadata=img.metadata,
+        dataset_statistics=img.dataset_statistics[:count] if img.dataset_statistics else None,
+    )
+
+
+class Pipeline(BaseAlgorithm):
+    """
+    Registered algorithms run one after the other as a single algorithm.
+
+    The plan is resolved (and the parameters of every step validated) once, when the pipeline is created.
+    Before every step the bands it does not use (beyond its `input_nbands`) are dropped, as views.
+    Steps implementing `apply(array) -> array` (e.g. binary_cleanup, mask) work in place on the data
+    and mask buffers of the previous step, which are only wrapped in an ImageData for the steps
+    needing one and at the end. The pipeline takes ownership of the image it processes.
+    """
+
+    title: str = "Pipeline"
+    description: str = "Run registered algorithms one after the other, e.g. flood_detection then binary_cleanup"
+
+    steps: List[PipelineStep] = Field(
+        default=[],
+        title="Steps",
+        description='Algorithms to run in order, e.g. [{"name": "flood_detection"}, {"name": "binary_cleanup", "params": {"min_size": 32}}]'
+    )
+
+    # metadata, from the steps
+    input_max_downsample: Optional[int] = None
+    output_resampling: Optional[str] = None
+
+    _stages: List[BaseAlgorithm] = PrivateAttr(default_factory=list)
+
+    @model_validator(mode="after")
+    def plan(self):
+        # the registry includes the pipelines, imported when the pipeline is created
+        from cogserver.algorithms import algorithms
+
+        if not self.steps:
+            raise ValueError("A pipeline needs at least one step")
+        stages = []
+        for step in self.steps:
+            try:
+                stages.append(algorithms.get(step.name)(**step.params))
+            except KeyError:
+                raise ValueError(f"Unknown algorithm {step.name!r} in the pipeline steps")
+            except ValidationError as e:
+                raise ValueError(f"Invalid {step.name!r} step parameters: {e}")
+        for previous, stage in zip(stages, stages[1:]):
+            if previous.output_nbands and stage.input_nbands and previous.output_nbands < stage.input_nbands:
+                raise ValueError(
+                    f"{type(stage).__name__} needs {stage.input_nbands} bands, "
+                    f"{type(previous).__name__} outputs {previous.output_nbands}"
+                )
+        self._stages = stages
+
+        self.input_nbands = stages[0].input_nbands
+        # the steps keeping the bands (no output_* metadata) keep the metadata of the previous ones
+        for stage in reversed(stages):
+            if stage.output_nbands or stage.output_dtype:
+                self.output_nbands = stage.output_nbands
+                self.output_dtype = stage.output_dtype
+                self.output_min = stage.output_min
+                self.output_max = stage.output_max
+                break
+        downsamples = [getattr(stage, "input_max_downsample", None) or 1 for stage in stages]
+        self.input_max_downsample = min(downsamples)
+        resamplings = [getattr(stage, "output_resampling", None) for stage in reversed(stages)]
+        self.output_resampling = next((resampling for resampling in resamplings if resampling), None)
+        return self
+
+    def fit(self, img: ImageData) -> "Pipeline":
+        """Copy of the pipeline with its steps fitted (`fit(img)`) in turn on `img` and the outputs of the previous steps"""
+        stages = []
+        for stage in self._stages:
+            if stage.input_nbands and img.count > stage.input_nbands:
+                img = first_bands(img, stage.input_nbands)
+            if hasattr(stage, "fit"):
+                stage = stage.fit(img)
+            stages.append(stage)
+            img = stage(img)
+        fitted = self.model_copy()
+        fitted._stages = stages
+        return fitted
+
+    def __call__(self, img: ImageData) -> ImageData:
+        array = None
+        for stage in self._stages:
+            if array is not None and not hasattr(stage, "apply"):
+                img = with_array(img, array)
+                array = None
+            count = array.shape[0] if array is not None else img.count
+            if stage.input_nbands and count > stage.input_nbands:
+                if array is not None:
+                    array = array[:stage.input_nbands]
+                else:
+                    img = first_bands(img, stage.input_nbands)
+            if hasattr(stage, "apply"):
+                array = stage.apply(array if array is not None else img.array)
+            else:
+                img = stage(img)
+        if array is not None:
+            img = with_array(img, array)
+        return img
+
+
+def named_pipeline(name: str, steps: List[Dict], title: str = None, description: str = None) -> Type[Pipeline]:
+    """
+    Pipeline class running `steps` (`{"name": ..., "params": {...}}`) by default, to register under a name.
+    The steps must be registered already, the metadata of the pipeline is resolved from them.
+    """
+    steps = [PipelineStep(**step) for step in steps]
+    plan = Pipeline(steps=steps)
+    metadata = {
+        field: (type(getattr(plan, field)), getattr(plan, field))
+        for field in type(plan).model_fields
+        if field.startswith(("input_", "output_")) and getattr(plan, field) is not None
+    }
+    return create_model(
+        name,
+        __base__=Pipeline,
+        steps=(List[PipelineStep], steps),
+        title=(str, title or name),
+        description=(str, description or " then ".join(step.name for step in steps)),
+        **metadata,
+    )
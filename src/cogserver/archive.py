@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import APIRouter, HTTPException, Path, Response
+from titiler.core.resources.enums import ImageType
+from typing_extensions import Annotated
+
+TILE_ARCHIVE_DIR = os.getenv("TILE_ARCHIVE_DIR", "/tmp/tiles")
+
+# the media types of the `/cog` tiles, for every format `python -m cogserver.seed --format` accepts
+MEDIA_TYPES = {image_type.name: image_type.mediatype for image_type in ImageType}
+
+
+class MBTilesArchive:
+    """
+    Minimal MBTiles (https://github.com/mapbox/mbtiles-spec) archive.
+
+    Tiles are addressed with XYZ coordinates and stored with the TMS row order mandated by the spec.
+    Lookups go through the (zoom_level, tile_column, tile_row) primary key so any tile is
+    a single index range scan no matter how large the archive grows. The tiles rendered without
+    valid pixels are recorded in an `empty_tiles` table (not part of the spec, ignored by readers)
+    so a resumed seeding skips them too. The metadata is read once per handle.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self._metadata: Optional[Dict[str, str]] = None
+        if readonly:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_data BLOB,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS empty_tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row)
+                ) WITHOUT ROWID;
+                """
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if not self.readonly:
+            self.connection.commit()
+        self.connection.close()
+
+    @staticmethod
+    def tms_row(z: int, y: int) -> int:
+        return (1 << z) - 1 - y
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        if self._metadata is None:
+            self._metadata = dict(self.connection.execute("SELECT name, value FROM metadata"))
+        return self._metadata
+
+    def set_metadata(self, **metadata):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            [(k, str(v)) for k, v in metadata.items() if v is not None],
+        )
+        self.connection.commit()
+        self._metadata = None
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        row = self.connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, self.tms_row(z, y)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, tiles: Iterable[Tuple[int, int, int, Optional[bytes]]]):
+        """
+        Write (z, x, y, data) tuples, None data recording an empty tile, and commit them, making them
+        visible to readers and to resume
+        """
+        tiles = [(z, x, self.tms_row(z, y), data) for z, x, y, data in tiles]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+            [(z, x, row, sqlite3.Binary(data)) for z, x, row, data in tiles if data is not None],
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO empty_tiles (zoom_level, tile_column, tile_row) VALUES (?, ?, ?)",
+            [(z, x, row) for z, x, row, data in tiles if data is None],
+        )
+        self.connection.commit()
+
+    def existing(self, z: int) -> Set[Tuple[int, int]]:
+        """XYZ (x, y) of the tiles already stored or recorded as empty at zoom z"""
+        return {
+            (x, self.tms_row(z, row))
+            for x, row in self.connection.execute(
+                "SELECT tile_column, tile_row FROM tiles WHERE zoom_level=? "
+                "UNION ALL SELECT tile_column, tile_row FROM empty_tiles WHERE zoom_level=?",
+                (z, z),
+            )
+        }
+
+
+_archives: Dict[str, MBTilesArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(name: str) -> MBTilesArchive:
+    """Return a cached read-only handle to the archive `name` located in TILE_ARCHIVE_DIR"""
+    path = os.path.join(TILE_ARCHIVE_DIR, f"{os.path.basename(name)}.mbtiles")
+    with _archives_lock:
+        if path not in _archives:
+            if not os.path.exists(path):
+                raise HTTPException(status_code=404, detail=f"Tile archive {name} does not exist")
+            _archives[path] = MBTilesArchive(path, readonly=True)
+        return _archives[path]
+
+
+router = APIRouter()
+
+
+@router.get(
+    "/{archive}/metadata",
+    responses={200: {"description": "Return the metadata of a tile archive."}},
+    operation_id="archive_get_metadata",
+)
+def archive_metadata(archive: Annotated[str, Path(description="Archive name")]):
+    return get_archive(archive).metadata
+
+
+@router.get(
+    "/{archive}/tiles/{z}/{x}/{y}",
+    response_class=Response,
+    responses={200: {"description": "Return a tile from a tile archive."}},
+    operation_id="archive_get_tile",
+)
+def archive_tile(
+        archive: Annotated[str, Path(description="Archive name")],
+        z: int,
+        x: int,
+        y: int,
+):
+    src = get_archive(archive)
+    data = src.get(z, x, y)
+    if data is None:
+        return Response(status_code=204)
+    media_type = MEDIA_TYPES.get(src.metadata.get("format"), "application/octet-stream")
+    return Response(data, media_type=media_type)
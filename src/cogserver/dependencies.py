@@ -2,6 +2,7 @@ from fastapi import Query
 from typing_extensions import Annotated
 from typing import List
 import base64
+from urllib.parse import urlsplit
 
 
 def parse_signed_url(url: str = None):
@@ -17,6 +18,12 @@ def parse_signed_url(url: str = None):
     return decoded_url
 
 
+def dataset_identity(url: str) -> str:
+    """Dataset URL without the query string, so the same blob signed with different SAS tokens is one dataset"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}" if parts.scheme else parts.path
+
+
 def SignedDatasetPath(url: Annotated[str, Query(description="Unsigned/signed dataset URL")]) -> str:
     """
         FastAPI dependency function that enables
@@ -0,0 +1,147 @@
+import functools
+import itertools
+import os
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import attr
+import numexpr
+import numpy
+from numexpr.necompiler import getContext, getExprNames, getType
+from rio_tiler.errors import InvalidExpression
+from rio_tiler.expression import apply_expression, get_expression_blocks, parse_expression, validate_expression
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
+
+EXPRESSION_CACHE_SIZE = int(os.getenv("EXPRESSION_CACHE_SIZE", 256))
+
+# same evaluation context rio_tiler's `apply_expression` ends up with through `numexpr.evaluate`
+CONTEXT = getContext({"truediv": False})
+
+# numexpr output kinds as found in the first char of `NumExpr.fullsig`
+KINDS = {
+    b"b": numpy.bool_,
+    b"i": numpy.int32,
+    b"l": numpy.int64,
+    b"f": numpy.float32,
+    b"d": numpy.float64,
+    b"c": numpy.complex128,
+}
+
+
+class CompiledExpression:
+    """
+    A rio-tiler band math expression (e.g. `((b1>0.5)&(b3<100))/b4;b2`) validated and parsed once.
+
+    Every block is compiled into a numexpr program per input dtype signature. The program evaluates the whole block
+    in a single fused and chunked pass and writes straight into the slice of the output stack holding the block,
+    so no temporary is allocated per sub-expression, per block or to stack the blocks.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = validate_expression(expression)
+        self.blocks = [block.strip() for block in get_expression_blocks(expression)]
+        self.indexes = parse_expression(expression)
+        try:
+            self.names = [getExprNames(block, CONTEXT) for block in self.blocks]
+        except (SyntaxError, TypeError, ValueError, KeyError) as e:
+            raise InvalidExpression(f"Invalid expression {expression}: {e}") from e
+        self._programs: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def programs(self, types: Dict[str, type]) -> List:
+        """numexpr programs for the blocks given the numexpr type of every band"""
+        key = tuple(sorted(types.items(), key=lambda t: t[0]))
+        programs = self._programs.get(key)
+        if programs is None:
+            with self._lock:
+                programs = self._programs.get(key)
+                if programs is None:
+                    programs = self._programs[key] = [
+                        numexpr.NumExpr(block, [(name, types[name]) for name in names], **CONTEXT)
+                        for block, (names, _) in zip(self.blocks, self.names)
+                    ]
+        return programs
+
+    def evaluate(self, band_names: Sequence[str], data: numpy.ndarray) -> numpy.ma.MaskedArray:
+        """Equivalent of `rio_tiler.expression.apply_expression(self.blocks, band_names, data)`"""
+        if len(band_names) != data.shape[0]:
+            raise ValueError(f"Incompatible number of bands ({band_names}) and data shape {data.shape}")
+
+        bands = dict(zip(band_names, numpy.ma.getdata(data)))
+        try:
+            types = {name: getType(bands[name]) for names, _ in self.names for name in names}
+        except KeyError as e:
+            raise InvalidExpression(f"Invalid band/asset name {str(e)}") from e
+
+        programs = self.programs(types)
+        dtype = numpy.result_type(*[KINDS[program.fullsig[:1]] for program in programs])
+        out = numpy.empty((len(programs),) + data.shape[1:], dtype=dtype)
+        for i, (program, (names, uses_vml)) in enumerate(zip(programs, self.names)):
+            arguments = [bands[name] for name in names]
+            if KINDS[program.fullsig[:1]] == dtype:
+                program(*arguments, out=out[i], order="K", casting="same_kind", ex_uses_vml=uses_vml)
+            else:
+                out[i] = program(*arguments, ex_uses_vml=uses_vml)
+        numpy.nan_to_num(out, copy=False)
+        return numpy.ma.MaskedArray(out)
+
+    def apply(self, img: ImageData) -> ImageData:
+        """Equivalent of `ImageData.apply_expression(self.expression)`"""
+        stats = img.dataset_statistics
+        if stats:
+            res = [apply_expression(self.blocks, img.band_names, numpy.array(prod)) for prod in itertools.product(*stats)]
+            stats = list(zip([min(r) for r in zip(*res)], [max(r) for r in zip(*res)]))
+
+        data = self.evaluate(img.band_names, img.array)
+        # NOTE: We use dataset mask when mixing bands
+        data.mask = numpy.logical_or.reduce(img.array.mask)
+
+        return ImageData(
+            data,
+            assets=img.assets,
+            crs=img.crs,
+            bounds=img.bounds,
+            band_names=self.blocks,
+            metadata=img.metadata,
+            dataset_statistics=stats,
+        )
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression: str) -> CompiledExpression:
+    """Return the cached CompiledExpression for expression"""
+    return CompiledExpression(expression)
+
+
+def with_compiled_expression(method, band_argument: str):
+    """
+    Wrap a reader method so the `expression` is evaluated with a CompiledExpression
+    instead of `ImageData.apply_expression`.
+
+    Args:
+        method: Reader method taking `expression` and `band_argument` keyword arguments and returning an ImageData
+        band_argument (str): name of the argument selecting the bands to read (`indexes` or `bands`)
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, expression: str = None, **kwargs):
+        if not expression:
+            return method(self, *args, **kwargs)
+        compiled = compile_expression(expression)
+        if band_argument == "indexes":
+            kwargs["indexes"] = compiled.indexes
+        else:
+            kwargs["bands"] = self.parse_expression(expression)
+        return compiled.apply(method(self, *args, **kwargs))
+
+    return wrapper
+
+
+@attr.s
+class ExpressionReader(Reader):
+    """rio-tiler Reader evaluating expressions with compiled and cached programs"""
+
+    # `tile`, `feature` and `preview`/`statistics` go through `part` and `read`
+    part = with_compiled_expression(Reader.part, "indexes")
+    read = with_compiled_expression(Reader.read, "indexes")
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy
+import rasterio
+from fastapi import Depends, HTTPException, Query
+from rasterio.shutil import copy as rio_copy
+from rasterio.windows import Window, bounds as window_bounds
+from rio_tiler.models import ImageData
+from titiler.core.factory import FactoryExtension, TilerFactory
+from titiler.core.resources.responses import JSONResponse
+from typing_extensions import Annotated
+
+from cogserver.algorithms import algorithms
+from cogserver.dependencies import SignedDatasetPath, dataset_identity
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZE_DIR = os.getenv("MATERIALIZE_DIR", "/tmp/materialized")
+# number of materialization jobs running at the same time
+MATERIALIZE_JOBS = int(os.getenv("MATERIALIZE_JOBS", 2))
+# number of chunks a job processes at the same time
+MATERIALIZE_THREADS = int(os.getenv("MATERIALIZE_THREADS", 4))
+MATERIALIZE_CHUNK_SIZE = int(os.getenv("MATERIALIZE_CHUNK_SIZE", 2048))
+
+
+def materialized_path(url: str, algorithm: str, algorithm_params: Optional[Dict] = None) -> str:
+    """Local COG path of the output of `algorithm` run with `algorithm_params` over the dataset at `url`"""
+    key = json.dumps(
+        {"dataset": dataset_identity(url), "algorithm": algorithm, "params": algorithm_params or {}},
+        sort_keys=True,
+    )
+    return os.path.join(MATERIALIZE_DIR, f"{algorithm}-{hashlib.sha1(key.encode()).hexdigest()}.tif")
+
+
+def decimated_read(src, max_size: int = 1024) -> numpy.ma.MaskedArray:
+    """Read of the whole dataset at most `max_size` pixels wide, which GDAL serves from the overviews"""
+    ratio = max(src.width, src.height) / max_size
+    out_shape = (src.count, max(1, round(src.height / max(ratio, 1))), max(1, round(src.width / max(ratio, 1))))
+    return src.read(out_shape=out_shape, masked=True)
+
+
+def dataset_statistics(data: numpy.ma.MaskedArray):
+    """Per band (min, max) of a decimated read, NaN for the fully masked bands"""
+    return [
+        (float(band.min()), float(band.max())) if band.count() else (float("nan"), float("nan"))
+        for band in data
+    ]
+
+
+def crop(img: ImageData, window: Window) -> ImageData:
+    """Output of the algorithm cropped to the window, for the algorithms not cropping the buffer they were read with"""
+    if (img.height, img.width) == (window.height, window.width):
+        return img
+    row_off, col_off = (img.height - window.height) // 2, (img.width - window.width) // 2
+    if row_off < 0 or col_off < 0:
+        raise ValueError(f"The algorithm output ({img.height}x{img.width}) is smaller than the chunk it processed")
+    return ImageData(
+        img.array[:, row_off:row_off + window.height, col_off:col_off + window.width],
+        crs=img.crs,
+        band_names=img.band_names,
+    )
+
+
+def materialize(url: str, algorithm: str, algorithm_params: Optional[Dict] = None, output: str = None,
+                chunk_size: int = MATERIALIZE_CHUNK_SIZE, threads: int = MATERIALIZE_THREADS) -> str:
+    """
+    Run a registered algorithm over the full extent of a dataset and save the result as a COG with overviews.
+
+    The dataset is processed in `chunk_size` windows, `threads` at a time. Every chunk is handed over to the
+    algorithm with the statistics of the whole dataset (`ImageData.dataset_statistics`) so algorithms normalizing
+    their input can do it consistently across chunks, and algorithms fitting parameters to their input
+    (`fit(img)`, e.g. the Otsu threshold of flood_detection) are fitted once on a decimated read of the whole
+    dataset, so the chunks do not show seams. Algorithms with a `buffer` (hillshade, slope) read their chunks
+    with it.
+
+    Args:
+        url (str): dataset URL
+        algorithm (str): name of the algorithm in `cogserver.algorithms`
+        algorithm_params (Dict, optional): algorithm parameters
+        output (str, optional): output path. Defaults to `materialized_path(url, algorithm, algorithm_params)`
+        chunk_size (int, optional): size of the processed windows in pixels
+        threads (int, optional): number of windows processed at the same time
+
+    Returns:
+        str: path of the COG
+    """
+    output = output or materialized_path(url, algorithm, algorithm_params)
+    post_process = algorithms.get(algorithm)(**(algorithm_params or {}))
+    buffer = int(getattr(post_process, "buffer", 0) or 0)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    local = threading.local()
+    handles = []
+
+    try:
+        with rasterio.open(url) as src:
+            preview = decimated_read(src)
+            stats = dataset_statistics(preview)
+            if hasattr(post_process, "fit"):
+                post_process = post_process.fit(ImageData(preview, crs=src.crs, bounds=src.bounds,
+                                                          dataset_statistics=stats))
+            windows = [
+                Window(col, row, min(chunk_size, src.width - col), min(chunk_size, src.height - row))
+                for row in range(0, src.height, chunk_size)
+                for col in range(0, src.width, chunk_size)
+            ]
+            profile = dict(crs=src.crs, transform=src.transform, width=src.width, height=src.height)
+
+            def process(window: Window) -> ImageData:
+                # rasterio datasets can not be shared between threads
+                if getattr(local, "src", None) is None:
+                    local.src = rasterio.open(url)
+                    handles.append(local.src)
+                read_window = Window(window.col_off - buffer, window.row_off - buffer,
+                                     window.width + 2 * buffer, window.height + 2 * buffer)
+                img = ImageData(
+                    local.src.read(window=read_window, masked=True, boundless=bool(buffer)),
+                    crs=src.crs,
+                    bounds=window_bounds(read_window, src.transform),
+                    dataset_statistics=stats,
+                )
+                return crop(post_process(img), window)
+
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmpdir:
+                tmp = os.path.join(tmpdir, "output.tif")
+                first = process(windows[0])
+                dtype = "int32" if first.array.dtype == numpy.int64 else first.array.dtype.name
+                with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+                    with rasterio.open(tmp, "w", driver="GTiff", tiled=True, blockxsize=512, blockysize=512,
+                                       count=first.count, dtype=dtype, **profile) as dst:
+                        def write(window: Window, img: ImageData):
+                            dst.write(img.array.data.astype(dtype), window=window)
+                            dst.write_mask(img.mask, window=window)
+
+                        write(windows[0], first)
+                        with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                            # at most two chunks per thread in flight, written from this thread only in
+                            # completion order and dropped once written, so the output is never held in memory
+                            in_flight: Dict[futures.Future, Window] = {}
+
+                            def drain(limit: int):
+                                while len(in_flight) > limit:
+                                    done, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                                    for task in done:
+                                        write(in_flight.pop(task), task.result())
+
+                            for window in windows[1:]:
+                                in_flight[executor.submit(process, window)] = window
+                                drain(2 * threads - 1)
+                            drain(0)
+
+                        if first.band_names:
+                            for bidx, name in enumerate(first.band_names, 1):
+                                dst.set_band_description(bidx, name)
+                        dst.update_tags(algorithm=algorithm, algorithm_params=json.dumps(algorithm_params or {}))
+
+                    # written in the private tmpdir: workers materializing the same output do not share a path
+                    cog = os.path.join(tmpdir, "cog.tif")
+                    rio_copy(tmp, cog, driver="COG", COMPRESS="DEFLATE", OVERVIEWS="AUTO")
+                os.replace(cog, output)
+    finally:
+        for handle in handles:
+            handle.close()
+    return output
+
+
+_executor = futures.ThreadPoolExecutor(max_workers=MATERIALIZE_JOBS, thread_name_prefix="materialize")
+_jobs: Dict[str, futures.Future] = {}
+_jobs_lock = threading.Lock()
+
+
+def submit(url: str, algorithm: str, algorithm_params: Optional[Dict] = None) -> Dict:
+    """
+    Start materializing unless the output already exists or is being produced.
+    A failed job is reported once, the next call starts it again
+
+    Returns:
+        Dict: status ("ready", "pending" or "failed") and url of the output
+    """
+    output = materialized_path(url, algorithm, algorithm_params)
+    with _jobs_lock:
+        job = _jobs.get(output)
+        if job is None:
+            if os.path.exists(output):
+                return {"status": "ready", "url": output}
+            job = _jobs[output] = _executor.submit(materialize, url, algorithm, algorithm_params, output)
+        elif job.done():
+            del _jobs[output]
+
+    if not job.done():
+        return {"status": "pending", "url": output}
+    if job.exception() is not None:
+        logger.error(f"Failed to materialize {algorithm} for {dataset_identity(url)}: {job.exception()}")
+        return {"status": "failed", "url": output, "error": str(job.exception())}
+    return {"status": "ready", "url": output}
+
+
+@dataclass
+class MaterializeExtension(FactoryExtension):
+    """
+    Adds a `/materialize` endpoint to a TilerFactory.
+    The endpoint runs an algorithm over a whole dataset in the background and writes the result into
+    a local COG that is rendered by the factory routes like any other dataset (`url=<returned url>`)
+    """
+
+    def register(self, factory: TilerFactory):
+        @factory.router.get(
+            "/materialize",
+            response_class=JSONResponse,
+            responses={
+                200: {"description": "The algorithm output is ready."},
+                202: {"description": "The algorithm output is being created."},
+                500: {"description": "The algorithm failed."},
+            },
+            operation_id="materialize_get",
+        )
+        def materialize_algorithm(
+                src_path=Depends(SignedDatasetPath),
+                algorithm: Annotated[str, Query(description="Algorithm name")] = None,
+                algorithm_params: Annotated[Optional[str], Query(description="Algorithm parameter")] = None,
+        ):
+            if algorithm not in algorithms.list():
+                raise HTTPException(status_code=400, detail=f"Invalid algorithm {algorithm}")
+            try:
+                params = json.loads(algorithm_params) if algorithm_params else {}
+                algorithms.get(algorithm)(**params)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e)) from e
+
+            status = submit(src_path, algorithm, params)
+            status_code = {"ready": 200, "pending": 202, "failed": 500}[status["status"]]
+            return JSONResponse(status, status_code=status_code)
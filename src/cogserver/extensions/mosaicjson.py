@@ -3,7 +3,8 @@ from typing import List, Optional
 
 from cogeo_mosaic.mosaic import MosaicJSON
 from cogserver.dependencies import SignedDatasetPaths
-from fastapi import Depends, Query
+from cogserver.streaming import cache_key, cached_response, iter_mosaicjson, streaming_response
+from fastapi import Depends, Query, Request
 from pydantic import BaseModel
 from titiler.core.factory import TilerFactory, FactoryExtension
 from titiler.core.resources.responses import JSONResponse
@@ -29,6 +30,15 @@ class MosaicJsonExtension(FactoryExtension):
             mosaicjson.attribution = attribution
         return mosaicjson
 
+    def mosaic_json_response(self, request: Request, urls=None, minzoom=None, maxzoom=None, attribution=None):
+        """Build (or reuse the cached and compressed) MosaicJSON and stream it"""
+        key = cache_key("mosaicjson", urls, minzoom, maxzoom, attribution)
+        response = cached_response(request, key)
+        if response is None:
+            mosaicjson = self.create_mosaic_json(urls=urls, minzoom=minzoom, maxzoom=maxzoom, attribution=attribution)
+            response = streaming_response(request, iter_mosaicjson(mosaicjson), "application/json", key=key)
+        return response
+
     # Register method is mandatory and must take a TilerFactory object as input
     def register(self, factory: TilerFactory):
         @factory.router.get(
@@ -41,13 +51,14 @@ class MosaicJsonExtension(FactoryExtension):
             operation_id=f"mosaicjson_get_build"
         )
         def build_mosaicJSON(
+                request: Request,
                 url=Depends(SignedDatasetPaths),
                 minzoom: Optional[int] = 0,
                 maxzoom: Optional[int] = 22,
                 attribution: Optional[str] = None
 
         ):
-            return self.create_mosaic_json(urls=url, minzoom=minzoom, maxzoom=maxzoom, attribution=attribution)
+            return self.mosaic_json_response(request, urls=url, minzoom=minzoom, maxzoom=maxzoom, attribution=attribution)
 
         @factory.router.post(
             "/build",
@@ -58,10 +69,10 @@ class MosaicJsonExtension(FactoryExtension):
                 200: {"description": "Return a MosaicJSON from multiple COGs."}},
             operation_id=f"mosaicjson_post_build"
         )
-        def build_mosaicJSON(payload: MosaicJsonCreateItem):
+        def build_mosaicJSON(request: Request, payload: MosaicJsonCreateItem):
             url = SignedDatasetPaths(payload.urls)
             minzoom = payload.minzoom
             maxzoom = payload.maxzoom
             attribution = payload.attribution
 
-            return self.create_mosaic_json(urls=url, minzoom=minzoom, maxzoom=maxzoom, attribution=attribution)
+            return self.mosaic_json_response(request, urls=url, minzoom=minzoom, maxzoom=maxzoom, attribution=attribution)
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import logging
+import math
+import os
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Iterator, List, Literal, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Query
+from pydantic import BaseModel
+from rio_tiler.errors import PointOutsideBounds
+from starlette.responses import StreamingResponse
+from titiler.core.factory import FactoryExtension, TilerFactory
+
+from cogserver.dependencies import SignedDatasetPaths, dataset_identity
+
+logger = logging.getLogger(__name__)
+
+# number of datasets read at the same time, for all the requests of a worker
+POINTS_CONCURRENCY = int(os.getenv("POINTS_CONCURRENCY", 16))
+
+_executor = futures.ThreadPoolExecutor(max_workers=POINTS_CONCURRENCY, thread_name_prefix="points")
+
+
+def parse_coordinates(coord: List[str]) -> List[Tuple[float, float]]:
+    coordinates = []
+    for c in coord:
+        try:
+            lon, lat = map(float, c.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid coordinate {c}, should be of form lon,lat")
+        coordinates.append((lon, lat))
+    return coordinates
+
+
+class PointsQuery(BaseModel):
+    urls: List[str]
+    coordinates: List[Tuple[float, float]]
+    bidx: Optional[List[int]] = None
+    expression: Optional[str] = None
+    format: Literal["json", "csv"] = "json"
+
+
+@dataclass
+class PointsExtension(FactoryExtension):
+    """
+    Adds a `/points` endpoint to a TilerFactory returning the values of one or more coordinates
+    in many datasets (e.g. the dated COGs of a time-series) with one request.
+
+    Every dataset is opened once, with the factory reader, and read for all the coordinates.
+    The datasets are read concurrently on a worker wide pool (POINTS_CONCURRENCY) and each result is streamed
+    as soon as it is available, so the response takes as long as the slowest read and not the sum of them.
+    """
+
+    def read_points(self, factory: TilerFactory, url: str, coordinates: List[Tuple[float, float]],
+                    bidx: Optional[List[int]] = None, expression: Optional[str] = None) -> Tuple[List[str], List]:
+        values = []
+        band_names = []
+        with factory.reader(url) as src_dst:
+            for lon, lat in coordinates:
+                try:
+                    pt = src_dst.point(lon, lat, indexes=bidx, expression=expression)
+                except PointOutsideBounds:
+                    values.append(None)
+                    continue
+                band_names = pt.band_names
+                values.append([
+                    None if m or (isinstance(v, float) and not math.isfinite(v)) else v
+                    for v, m in zip(pt.array.data.tolist(), pt.array.mask.tolist())
+                ])
+        return band_names, values
+
+    def results(self, factory: TilerFactory, urls: List[str], coordinates: List[Tuple[float, float]],
+                bidx: Optional[List[int]] = None, expression: Optional[str] = None) -> Iterator[dict]:
+        tasks = {
+            _executor.submit(self.read_points, factory, url, coordinates, bidx, expression): i
+            for i, url in enumerate(urls)
+        }
+        try:
+            for task in futures.as_completed(tasks):
+                i = tasks[task]
+                # the signed URL is not echoed back, only the dataset it points to
+                result = {"index": i, "url": dataset_identity(urls[i])}
+                try:
+                    result["band_names"], result["values"] = task.result()
+                except Exception as e:
+                    # GDAL messages hold the signed /vsicurl/ path, they are only logged
+                    logger.info(f"Could not read {result['url']}: {e}")
+                    result["error"] = f"{type(e).__name__}: could not read {result['url']}"
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream(self, results: Iterator[dict], coordinates: List[Tuple[float, float]], format: str):
+        # masked, NaN and infinite values are null (JSON) / empty (CSV), the datasets that could not be read
+        # have an error instead of values
+        if format == "csv":
+            def rows():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(["index", "url", "lon", "lat", "band", "value", "error"])
+                for result in results:
+                    error = result.get("error")
+                    for (lon, lat), values in zip(coordinates, result.get("values") or [None] * len(coordinates)):
+                        for band, value in zip(result.get("band_names") or [None], values or [None]):
+                            writer.writerow([result["index"], result["url"], lon, lat, band, value, error])
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+
+            return StreamingResponse(rows(), media_type="text/csv")
+
+        def items():
+            yield '{"coordinates":' + json.dumps(coordinates, separators=(",", ":")) + ',"results":['
+            for n, result in enumerate(results):
+                yield ("," if n else "") + json.dumps(result, separators=(",", ":"))
+            yield "]}"
+
+        return StreamingResponse(items(), media_type="application/json")
+
+    def register(self, factory: TilerFactory):
+        @factory.router.get(
+            "/points",
+            responses={200: {"description": "Return the values of coordinates in multiple datasets."}},
+            operation_id="points_get",
+        )
+        def points(
+                url=Depends(SignedDatasetPaths),
+                coord: List[str] = Query(..., description="lon,lat coordinate. Can be set multiple times"),
+                bidx: Optional[List[int]] = Query(None, description="Dataset band indexes"),
+                expression: Optional[str] = Query(None, description="rio-tiler's band math expression"),
+                format: Literal["json", "csv"] = Query("json", description="Response format"),
+        ):
+            coordinates = parse_coordinates(coord)
+            return self.stream(self.results(factory, url, coordinates, bidx, expression), coordinates, format)
+
+        @factory.router.post(
+            "/points",
+            responses={200: {"description": "Return the values of coordinates in multiple datasets."}},
+            operation_id="points_post",
+        )
+        def points(payload: PointsQuery):
+            url = SignedDatasetPaths(payload.urls)
+            coordinates = [tuple(c) for c in payload.coordinates]
+            return self.stream(
+                self.results(factory, url, coordinates, payload.bidx, payload.expression),
+                coordinates,
+                payload.format,
+            )
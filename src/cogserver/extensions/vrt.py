@@ -2,15 +2,17 @@ import re
 import tempfile
 from typing import List, Literal, Optional
 
-from fastapi import Query, Response
+from fastapi import Query, Request, Response
 from osgeo import gdal
 from pydantic import BaseModel
 from titiler.core.factory import FactoryExtension
+from cogserver.statistics import statistics_metadata, vrt_statistics
+from cogserver.streaming import cache_key, cached_response, iter_element, streaming_response
 from cogserver.vrt import VRTFactory
 from xml.etree import ElementTree as ET
 
 
-def create_vrt_from_urls(
+def build_vrt_from_urls(
         urls: List[str],
         resolution: Literal["highest", "lowest", "average", "user"] = "average",
         xRes: float = None,
@@ -18,6 +20,7 @@ def create_vrt_from_urls(
         vrtNoData: List[int] = None,
         srcNoData: List[int] = None,
         resamplingAlg: Literal["nearest", "bilinear", "cubic", "cubicspline", "lanczos", "average", "mode"] = "nearest",
+        statistics: bool = False,
 
 ):
     """
@@ -31,9 +34,10 @@ def create_vrt_from_urls(
         vrtNoData (List[int], optional): Set nodata values at the VRT band level (different values can be supplied for each band). If the option is not specified, intrinsic nodata settings on the first dataset will be used (if they exist). The value set by this option is written in the NoDataValue element of each VRTRasterBand element. Use a value of None to ignore intrinsic nodata settings on the source datasets. Defaults to 0.
         srcNoData (List[int], optional): Set nodata values for input bands (different values can be supplied for each band). If the option is not specified, the intrinsic nodata settings on the source datasets will be used (if they exist). The value set by this option is written in the NODATA element of each ComplexSource element. Use a value of None to ignore intrinsic nodata settings on the source datasets. Defaults to 0.
         resamplingAlg (Literal["nearest", "bilinear", "cubic", "cubicspline", "lanczos", "average", "mode"], optional): Resampling algorithm. Defaults to "nearest".
+        statistics (bool, optional): Compute the statistics of every band through the VRT (its nodata and data type apply), on the source overviews, and embed them as STATISTICS_* band metadata. Defaults to False.
 
     Returns:
-        str: VRT XML
+        ET.Element: VRTDataset element
     """
     urls = [f"/vsicurl/{url}" for url in urls]
 
@@ -81,6 +85,13 @@ def create_vrt_from_urls(
             for source_band in available_bands:
                 if largest_index > -1:
                     source_band.set("dataType", data_types[largest_index])
+
+            # read through the VRT, with its nodata and data type
+            band_statistics = [None] * len(available_bands)
+            if statistics:
+                band_statistics = vrt_statistics(file_text)
+
+            for source_band, stats in zip(available_bands, band_statistics):
                 source = None
                 complex_source = source_band.find("ComplexSource")
                 simple_source = source_band.find("SimpleSource")
@@ -104,6 +115,8 @@ def create_vrt_from_urls(
                     matches = re.findall(pattern, dataset_metadata)
                     for match in matches:
                         metadata_dict[match[0].strip()] = match[1].strip()
+                    if stats is not None:
+                        metadata_dict.update(statistics_metadata(stats))
 
                     source_band.append(ET.Element("Metadata"))
                     source_band.append(ET.Element("ColorInterp"))
@@ -113,7 +126,27 @@ def create_vrt_from_urls(
                         metadata.set("key", key)
                         metadata.text = value
                         source_band.find("Metadata").append(metadata)
-            return ET.tostring(file_text, encoding="unicode")
+            return file_text
+
+
+def create_vrt_from_urls(urls: List[str], **kwargs) -> str:
+    """
+    Create a VRT from multiple COGs supplied as URLs (see `build_vrt_from_urls` for the options)
+
+    Returns:
+        str: VRT XML
+    """
+    return ET.tostring(build_vrt_from_urls(urls, **kwargs), encoding="unicode")
+
+
+def vrt_response(request: Request, urls: List[str], **kwargs):
+    """Build (or reuse the cached and compressed) VRT and stream it"""
+    key = cache_key("vrt", urls, kwargs)
+    response = cached_response(request, key)
+    if response is None:
+        vrt = build_vrt_from_urls(urls, **kwargs)
+        response = streaming_response(request, iter_element(vrt), "application/xml", key=key)
+    return response
 
 
 class VrtCreationParameters(BaseModel):
@@ -125,6 +158,7 @@ class VrtCreationParameters(BaseModel):
     resamplingAlg: Literal[
         "nearest", "bilinear", "cubic", "cubicspline", "lanczos", "average", "mode"]
     resolution: Literal["highest", "lowest", "average"]
+    statistics: bool = False
 
 
 class VRTExtension(FactoryExtension):
@@ -151,6 +185,7 @@ class VRTExtension(FactoryExtension):
             operation_id=f"vrt_get"
         )
         def create_vrt(
+                request: Request,
                 url: List[str] = Query(..., description="Dataset URLs"),
 
                 srcNoData: List[int] = Query(None,
@@ -165,7 +200,9 @@ class VRTExtension(FactoryExtension):
                 xRes: Optional[float] = Query(None,
                                               description="X resolution. Applicable only when `resolution` is `user`"),
                 yRes: Optional[float] = Query(None,
-                                              description="Y resolution. Applicable only when `resolution` is `user`")
+                                              description="Y resolution. Applicable only when `resolution` is `user`"),
+                statistics: bool = Query(False,
+                                         description="Embed the bands statistics (computed on the sources overviews) as STATISTICS_* metadata")
         ):
             if len(url) < 1:
                 return Response("Please provide at least two URLs", status_code=400)
@@ -173,15 +210,17 @@ class VRTExtension(FactoryExtension):
             if resolution == "user" and (not xRes or not yRes):
                 return Response("Please provide xRes and yRes for user resolution", status_code=400)
 
-            return Response(create_vrt_from_urls(
+            return vrt_response(
+                request,
                 urls=url,
                 xRes=xRes,
                 yRes=yRes,
                 srcNoData=srcNoData,
                 vrtNoData=vrtNoData,
                 resamplingAlg=resamplingAlg,
-                resolution=resolution
-            ), media_type="application/xml")
+                resolution=resolution,
+                statistics=statistics
+            )
 
         @factory.router.post(
             "",
@@ -191,17 +230,20 @@ class VRTExtension(FactoryExtension):
             operation_id=f"vrt_post"
         )
         def create_vrt(
+                request: Request,
                 payload: VrtCreationParameters,
         ):
             urls = payload.urls
             if len(urls) < 1:
                 return Response("Please provide at least one URL", status_code=400)
-            return Response(create_vrt_from_urls(
+            return vrt_response(
+                request,
                 urls=urls,
                 xRes=payload.xRes,
                 yRes=payload.yRes,
                 srcNoData=payload.srcNoData,
                 vrtNoData=payload.vrtNoData,
                 resamplingAlg=payload.resamplingAlg,
-                resolution=payload.resolution
-            ), media_type="application/xml")
+                resolution=payload.resolution,
+                statistics=payload.statistics
+            )
@@ -0,0 +1,287 @@
+import logging
+import math
+import os
+from collections import defaultdict
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy
+import rasterio
+from fastapi import Body, Depends, Query
+from geojson_pydantic import FeatureCollection
+from rasterio.enums import MergeAlg
+from rasterio.features import rasterize
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_geom
+from rio_tiler.constants import WGS84_CRS
+from rio_tiler.models import ImageData
+from titiler.core.dependencies import CoordCRSParams
+from titiler.core.factory import FactoryExtension, TilerFactory
+from typing_extensions import Annotated
+
+from cogserver.dependencies import dataset_identity
+
+logger = logging.getLogger(__name__)
+
+# zones whose bounds center fall in the same ZONAL_WINDOW_SIZE x ZONAL_WINDOW_SIZE block of dataset pixels share a read
+ZONAL_WINDOW_SIZE = int(os.getenv("ZONAL_WINDOW_SIZE", 2048))
+# number of windows read and reduced at the same time
+ZONAL_THREADS = int(os.getenv("ZONAL_THREADS", 4))
+# default maximum size of a window read, larger windows (zones bigger than a block) are read at a lower resolution
+ZONAL_MAX_SIZE = int(os.getenv("ZONAL_MAX_SIZE", 4096))
+
+
+def geometry_bounds(geometry: Dict) -> Tuple[float, float, float, float]:
+    """Bounds of a GeoJSON geometry"""
+    if geometry["type"] == "GeometryCollection":
+        bounds = [geometry_bounds(g) for g in geometry["geometries"]]
+        return (
+            min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds),
+        )
+    coords = numpy.array(list(flatten_coordinates(geometry["coordinates"])), dtype="float64")
+    return tuple(coords.min(axis=0)[:2].tolist() + coords.max(axis=0)[:2].tolist())
+
+
+def flatten_coordinates(coords):
+    if isinstance(coords[0], (int, float)):
+        yield coords
+    else:
+        for c in coords:
+            yield from flatten_coordinates(c)
+
+
+def plan_windows(zone_bounds: Sequence[Tuple[float, float, float, float]], transform,
+                 window_size: int = ZONAL_WINDOW_SIZE) -> List[Tuple[Tuple[float, float, float, float], List[int]]]:
+    """
+    Group the zones into merged read windows.
+
+    Each zone goes to the block of `window_size` dataset pixels holding the center of its bounds and
+    every block is read once, over the union of the bounds of its zones.
+
+    Returns:
+        List[Tuple]: (window bounds, zone indexes) for every non empty block
+    """
+    inverse = ~transform
+    blocks = defaultdict(list)
+    for i, (minx, miny, maxx, maxy) in enumerate(zone_bounds):
+        col, row = inverse * ((minx + maxx) / 2, (miny + maxy) / 2)
+        blocks[(math.floor(col / window_size), math.floor(row / window_size))].append(i)
+
+    windows = []
+    for zones in blocks.values():
+        bounds = numpy.array([zone_bounds[i] for i in zones])
+        windows.append(
+            ((bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()), zones)
+        )
+    return windows
+
+
+def labelled_statistics(values: numpy.ndarray, labels: numpy.ndarray, nlabels: int,
+                        percentiles: Sequence[int]) -> Dict[str, numpy.ndarray]:
+    """
+    Statistics of `values` grouped by `labels` (0..nlabels-1) computed with bincount reductions and one
+    sort of the values by (label, value) for min/max/median/percentiles
+
+    Returns:
+        Dict[str, numpy.ndarray]: every statistic for all the labels, NaN for labels without values
+    """
+    counts = numpy.bincount(labels, minlength=nlabels)
+    sums = numpy.bincount(labels, weights=values, minlength=nlabels)
+    has = counts > 0
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        deviations = numpy.bincount(labels, weights=(values - means[labels]) ** 2, minlength=nlabels)
+        stds = numpy.sqrt(deviations / counts)
+
+    order = numpy.lexsort((values, labels))
+    ordered = values[order]
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    last = numpy.maximum(counts - 1, 0)
+
+    def percentile(p):
+        # numpy's default (linear) method, on every sorted segment at once
+        position = starts + last * p / 100
+        low = numpy.floor(position).astype("int64")
+        high = numpy.ceil(position).astype("int64")
+        low, high = numpy.minimum(low, len(ordered) - 1), numpy.minimum(high, len(ordered) - 1)
+        result = ordered[low] + (ordered[high] - ordered[low]) * (position - low) if len(ordered) else position
+        return numpy.where(has, result, numpy.nan)
+
+    stats = {
+        "min": percentile(0),
+        "max": percentile(100),
+        "mean": numpy.where(has, means, numpy.nan),
+        "count": counts.astype("float64"),
+        "sum": sums,
+        "std": numpy.where(has, stds, numpy.nan),
+        "median": percentile(50),
+    }
+    for p in percentiles:
+        stats[f"percentile_{p}"] = percentile(p)
+    return stats
+
+
+def zone_layers(geometries: List[Dict], shape: Tuple[int, int], transform) -> List[List[int]]:
+    """
+    Split the zones into layers of zones sharing no pixel, so every layer is burnt into one label array.
+
+    When no pixel is claimed by more than one zone there is a single layer. Otherwise the zones without any shared
+    pixel in their bounds stay in the first layer, and the others are spread greedily over the layers so the
+    pixel bounds of the zones of a layer are disjoint.
+    """
+    n = len(geometries)
+    if n < 2:
+        return [list(range(n))]
+    shared = rasterize(
+        [(g, 1) for g in geometries], out_shape=shape, transform=transform, fill=0,
+        dtype="uint16", merge_alg=MergeAlg.add,
+    ) > 1
+    if not shared.any():
+        return [list(range(n))]
+
+    # number of shared pixels in any window from the summed area table
+    table = numpy.pad(shared.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    inverse = ~transform
+    layers: List[List[int]] = [[]]
+    extents: List[List[Tuple[int, int, int, int]]] = [[]]
+    for i, geometry in enumerate(geometries):
+        minx, miny, maxx, maxy = geometry_bounds(geometry)
+        (col0, row0), (col1, row1) = inverse * (minx, maxy), inverse * (maxx, miny)
+        col0, row0 = max(math.floor(col0), 0), max(math.floor(row0), 0)
+        col1, row1 = min(math.ceil(col1), shape[1]), min(math.ceil(row1), shape[0])
+        if col1 <= col0 or row1 <= row0 or not (
+            table[row1, col1] - table[row0, col1] - table[row1, col0] + table[row0, col0]
+        ):
+            layers[0].append(i)
+            continue
+        for layer, boxes in zip(layers, extents):
+            if all(col1 <= b[0] or b[2] <= col0 or row1 <= b[1] or b[3] <= row0 for b in boxes):
+                break
+        else:
+            layers.append([])
+            extents.append([])
+            layer, boxes = layers[-1], extents[-1]
+        layer.append(i)
+        boxes.append((col0, row0, col1, row1))
+    return layers
+
+
+def zonal_statistics(img: ImageData, geometries: List[Dict], percentiles: Sequence[int]) -> List[Optional[Dict]]:
+    """
+    Per band statistics of every geometry (in the image CRS) over the image.
+
+    The geometries are burnt into label arrays, one per layer of geometries sharing no pixel (see `zone_layers`),
+    and every band is reduced for all the geometries of a layer at once.
+    """
+    n = len(geometries)
+    transform = from_bounds(*img.bounds, img.width, img.height)
+    shape = (img.height, img.width)
+    pixels = numpy.zeros(n, dtype="int64")
+    results: List[Dict] = [{} for _ in range(n)]
+    for layer in zone_layers(geometries, shape, transform):
+        labels = rasterize(
+            [(geometries[i], k + 1) for k, i in enumerate(layer)], out_shape=shape, transform=transform, fill=0,
+            dtype="int32",
+        )
+        inside = labels > 0
+        pixels[layer] = numpy.bincount(labels[inside] - 1, minlength=len(layer))
+        for b, band in enumerate(img.band_names):
+            data = img.array.data[b]
+            valid = inside & ~img.array.mask[b]
+            stats = labelled_statistics(data[valid].astype("float64"), labels[valid] - 1, len(layer), percentiles)
+            for k, i in enumerate(layer):
+                results[i][band] = {key: v[k] for key, v in stats.items()}
+
+    output = []
+    for i, result in enumerate(results):
+        if not pixels[i]:
+            output.append(None)
+            continue
+        for band_stats in result.values():
+            band_stats["valid_pixels"] = band_stats["count"]
+            band_stats["masked_pixels"] = float(pixels[i] - band_stats["count"])
+            band_stats["valid_percent"] = round(band_stats["count"] / pixels[i] * 100, 2)
+            for k, v in band_stats.items():
+                band_stats[k] = None if numpy.isnan(v) else float(v)
+        output.append(result)
+    return output
+
+
+@dataclass
+class ZonalStatisticsExtension(FactoryExtension):
+    """
+    Adds a `/zonal_statistics` endpoint to a TilerFactory computing the statistics of every feature of a
+    FeatureCollection in one pass (instead of one `/statistics` request per polygon).
+
+    The zones are grouped into merged windows (see `plan_windows`), each window is read once, optionally
+    processed by an algorithm, and reduced for all its zones with `zonal_statistics`.
+    """
+
+    def register(self, factory: TilerFactory):
+        @factory.router.post(
+            "/zonal_statistics",
+            response_model=FeatureCollection,
+            response_model_exclude_none=True,
+            responses={200: {"description": "Return the statistics of every feature of a FeatureCollection."}},
+            operation_id="zonal_statistics_post",
+        )
+        def zonal(
+                geojson: Annotated[FeatureCollection, Body(description="GeoJSON FeatureCollection of zones.")],
+                src_path=Depends(factory.path_dependency),
+                reader_params=Depends(factory.reader_dependency),
+                coord_crs=Depends(CoordCRSParams),
+                layer_params=Depends(factory.layer_dependency),
+                dataset_params=Depends(factory.dataset_dependency),
+                post_process=Depends(factory.process_dependency),
+                max_size: Annotated[
+                    int, Query(description="Maximum size of the windows read, larger windows are read at a lower resolution")
+                ] = ZONAL_MAX_SIZE,
+                percentiles: Annotated[
+                    Optional[List[int]], Query(alias="p", description="List of percentile values (default to [2, 98]).")
+                ] = None,
+                env=Depends(factory.environment_dependency),
+        ):
+            percentiles = percentiles or [2, 98]
+            with rasterio.Env(**env):
+                with factory.reader(src_path, **reader_params.as_dict()) as src_dst:
+                    crs, transform = src_dst.crs, src_dst.transform
+
+            # features without geometry are left without statistics
+            features = [f for f in geojson.features if f.geometry is not None]
+            geometries = [
+                transform_geom(coord_crs or WGS84_CRS, crs, f.geometry.model_dump(exclude_none=True))
+                for f in features
+            ]
+            windows = plan_windows([geometry_bounds(g) for g in geometries], transform)
+
+            def process(bounds, zones):
+                try:
+                    with rasterio.Env(**env):
+                        with factory.reader(src_path, **reader_params.as_dict()) as src_dst:
+                            img = src_dst.part(
+                                bounds,
+                                dst_crs=crs,
+                                bounds_crs=crs,
+                                max_size=max_size,
+                                align_bounds_with_dataset=True,
+                                **layer_params.as_dict(),
+                                **dataset_params.as_dict(),
+                            )
+                    if post_process:
+                        img = post_process(img)
+                    return zones, zonal_statistics(img, [geometries[i] for i in zones], percentiles), None
+                except Exception as e:
+                    # only the zones of the failed window are lost, GDAL messages hold the signed path so are only logged
+                    logger.warning(f"Could not read {bounds} in {dataset_identity(src_path)}: {e}")
+                    return zones, [None] * len(zones), f"{type(e).__name__}: could not read the zone"
+
+            with futures.ThreadPoolExecutor(max_workers=ZONAL_THREADS) as executor:
+                for zones, stats, error in executor.map(lambda w: process(*w), windows):
+                    for i, zone_stats in zip(zones, stats):
+                        feature = features[i]
+                        feature.properties = feature.properties or {}
+                        feature.properties.update({"error": error} if error else {"statistics": zone_stats})
+
+            return geojson
@@ -0,0 +1,229 @@
+import ctypes
+import gc
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import rasterio._base
+from rasterio.env import get_gdal_config, set_gdal_config
+
+from cogserver.expression import compile_expression
+from cogserver.prefetch import header_sizes
+from cogserver.stac import stac_items
+from cogserver.streaming import RESPONSE_CACHE_BYTES, response_cache
+
+logger = logging.getLogger(__name__)
+
+# memory of the node (container) given to the server, in bytes or as a percentage of the available memory
+MEMORY_BUDGET = os.getenv("MEMORY_BUDGET", "75%")
+# processes sharing the budget: the gunicorn workers, started with --workers=${WORKERS} in the Docker image
+# (which takes precedence over WEB_CONCURRENCY)
+WORKERS = int(os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or 1)
+# shares of a worker budget given to the cache tiers, the rest is left to the requests
+MEMORY_GDAL_CACHE_SHARE = float(os.getenv("MEMORY_GDAL_CACHE_SHARE", 0.4))
+MEMORY_VSI_CACHE_SHARE = float(os.getenv("MEMORY_VSI_CACHE_SHARE", 0.1))
+MEMORY_APP_CACHE_SHARE = float(os.getenv("MEMORY_APP_CACHE_SHARE", 0.05))
+# datasets expected to be open at the same time in a worker, VSI_CACHE_SIZE applies to every open file
+MEMORY_OPEN_DATASETS = int(os.getenv("MEMORY_OPEN_DATASETS", 16))
+# the caches are trimmed when the RSS of the worker exceeds this share of its budget
+MEMORY_TRIM_THRESHOLD = float(os.getenv("MEMORY_TRIM_THRESHOLD", 0.85))
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", 5))
+# when a trim leaves the RSS above the threshold (the memory is held by the requests, not the caches), the next
+# trims are delayed twice as long every time, up to this delay (seconds), until the RSS falls below the threshold
+MEMORY_TRIM_BACKOFF_MAX = float(os.getenv("MEMORY_TRIM_BACKOFF_MAX", 300))
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# the GDAL library rasterio is linked against (rasterio does not expose the block cache settings)
+_gdal = ctypes.CDLL(rasterio._base.__file__)
+_gdal.GDALGetCacheMax64.restype = ctypes.c_int64
+_gdal.GDALGetCacheUsed64.restype = ctypes.c_int64
+_gdal.GDALSetCacheMax64.argtypes = [ctypes.c_int64]
+
+
+def available_memory() -> int:
+    """Physical memory of the node, or the memory limit of the container cgroup when lower"""
+    total = os.sysconf("SC_PHYS_PAGES") * PAGE_SIZE
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            total = min(total, int(limit))
+        break
+    return total
+
+
+def parse_budget(budget: str, total: int) -> int:
+    if budget.endswith("%"):
+        return int(total * float(budget[:-1]) / 100)
+    return int(budget)
+
+
+def rss() -> int:
+    """Resident memory of the process"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def malloc_trim():
+    """Give the memory freed by the caches back to the OS (glibc keeps it in its arenas otherwise)"""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+@dataclass
+class CacheTier:
+    """An application cache under the memory budget"""
+
+    name: str
+    usage: Callable[[], Dict]
+    trim: Optional[Callable[[], None]] = None
+    # applies a byte limit to the cache, caches without one are only trimmed
+    limit: Optional[Callable[[int], None]] = None
+
+
+class MemoryGovernor:
+    """
+    Splits the node memory budget (MEMORY_BUDGET) between the workers and, in every worker, between
+    the GDAL block cache, the VSI caches and the application caches, then watches the RSS of the worker
+    and trims all the caches when it gets close to the worker budget.
+    """
+
+    def __init__(self, budget: str = MEMORY_BUDGET, workers: int = WORKERS):
+        self.node_budget = parse_budget(budget, available_memory())
+        self.worker_budget = self.node_budget // max(workers, 1)
+        self.limits = {
+            "gdal_block_cache": int(self.worker_budget * MEMORY_GDAL_CACHE_SHARE),
+            "vsi_cache": int(self.worker_budget * MEMORY_VSI_CACHE_SHARE),
+            "app_caches": int(self.worker_budget * MEMORY_APP_CACHE_SHARE),
+        }
+        self.tiers: Dict[str, CacheTier] = {}
+        self.trims = 0
+        self.backoff = 0.0
+        self.next_trim = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, tier: CacheTier):
+        self.tiers[tier.name] = tier
+
+    def configure(self):
+        """
+        Apply the limits of the cache tiers, before the datasets are opened: GDAL reads the size of the
+        /vsicurl/ blocks cache once, when the first /vsicurl/ file is read
+        """
+        _gdal.GDALSetCacheMax64(self.limits["gdal_block_cache"])
+        # half for the per file handle caches, half for the /vsicurl/ blocks cache shared by all the files
+        vsi = self.limits["vsi_cache"] // 2
+        set_gdal_config("VSI_CACHE_SIZE", str(vsi // MEMORY_OPEN_DATASETS))
+        set_gdal_config("CPL_VSIL_CURL_CACHE_SIZE", str(vsi))
+        limited = [tier for tier in self.tiers.values() if tier.limit]
+        for tier in limited:
+            tier.limit(self.limits["app_caches"] // len(limited))
+        logger.info(f"Memory budget of the worker {self.worker_budget} bytes, cache limits {self.limits}")
+
+    def trim(self):
+        """Empty all the caches"""
+        before = rss()
+        _gdal.GDALSetCacheMax64(0)
+        _gdal.GDALSetCacheMax64(self.limits["gdal_block_cache"])
+        _gdal.VSICurlClearCache()
+        for tier in self.tiers.values():
+            if tier.trim:
+                tier.trim()
+        gc.collect()
+        malloc_trim()
+        self.trims += 1
+        logger.warning(f"Memory pressure, caches trimmed: RSS {before} -> {rss()} bytes (budget {self.worker_budget})")
+
+    def check(self):
+        threshold = self.worker_budget * MEMORY_TRIM_THRESHOLD
+        if rss() <= threshold:
+            self.backoff = 0.0
+            return
+        now = time.monotonic()
+        if now < self.next_trim:
+            return
+        self.trim()
+        if rss() > threshold:
+            self.backoff = min(max(self.backoff * 2, MEMORY_CHECK_INTERVAL * 2), MEMORY_TRIM_BACKOFF_MAX)
+            self.next_trim = now + self.backoff
+            logger.warning(f"RSS still above the trim threshold, next trim in {self.backoff} s at the earliest")
+
+    def watch(self):
+        while not self._stop.wait(MEMORY_CHECK_INTERVAL):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Memory check failed: {e}")
+
+    def start(self):
+        """Configure the caches and start watching the RSS (once per worker, after the fork)"""
+        if self._thread is None:
+            self.configure()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.watch, name="memory-governor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            "node_budget": self.node_budget,
+            "worker_budget": self.worker_budget,
+            "rss": rss(),
+            "trims": self.trims,
+            "trim_backoff": self.backoff,
+            "tiers": {
+                "gdal_block_cache": {
+                    "limit": _gdal.GDALGetCacheMax64(),
+                    "used": _gdal.GDALGetCacheUsed64(),
+                },
+                "vsi_cache": {
+                    "limit": self.limits["vsi_cache"],
+                    "per_file_limit": int(get_gdal_config("VSI_CACHE_SIZE") or 0),
+                },
+                **{name: tier.usage() for name, tier in self.tiers.items()},
+            },
+        }
+
+
+def limit_stac_items(maxbytes: int):
+    stac_items.maxbytes = maxbytes
+
+
+def limit_responses(maxbytes: int):
+    response_cache.maxbytes = min(maxbytes, RESPONSE_CACHE_BYTES)
+
+
+governor = MemoryGovernor()
+governor.register(CacheTier(
+    "stac_items",
+    usage=lambda: {"limit": stac_items.maxbytes, "used": stac_items.nbytes, "entries": len(stac_items.items)},
+    trim=stac_items.clear,
+    limit=limit_stac_items,
+))
+governor.register(CacheTier(
+    "responses",
+    usage=lambda: {"limit": response_cache.maxbytes, "used": response_cache.nbytes,
+                   "entries": len(response_cache.entries)},
+    trim=response_cache.clear,
+    limit=limit_responses,
+))
+governor.register(CacheTier(
+    "expressions",
+    usage=lambda: {"entries": compile_expression.cache_info().currsize},
+    trim=compile_expression.cache_clear,
+))
+# a few bytes per dataset saving several requests per open, never trimmed
+governor.register(CacheTier("header_prefetch", usage=lambda: {"entries": len(header_sizes.sizes)}))
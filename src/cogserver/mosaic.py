@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import warnings
+from collections import Counter
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy
+from cogeo_mosaic.backends import MosaicBackend
+from cogeo_mosaic.errors import NoAssetFoundError
+from morecantile import Tile
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.errors import EmptyMosaicError, TileOutsideBounds
+from rio_tiler.models import ImageData
+from rio_tiler.mosaic.methods.base import MosaicMethodBase
+from rio_tiler.mosaic.methods.defaults import FirstMethod
+from rio_tiler.utils import resize_array
+
+logger = logging.getLogger(__name__)
+
+# number of asset reads a single tile request may have in flight
+MOSAIC_REQUEST_CONCURRENCY = int(os.getenv("MOSAIC_REQUEST_CONCURRENCY", 4))
+# number of asset reads all the requests of this worker may have in flight
+MOSAIC_GLOBAL_CONCURRENCY = int(os.getenv("MOSAIC_GLOBAL_CONCURRENCY", 16))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> futures.ThreadPoolExecutor:
+    """
+    Return the worker wide thread pool used to read mosaic assets.
+    The pool is created lazily so forked (gunicorn) workers each own their threads
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = futures.ThreadPoolExecutor(
+                    max_workers=MOSAIC_GLOBAL_CONCURRENCY,
+                    thread_name_prefix="mosaic-read",
+                )
+    return _executor
+
+
+@dataclass
+class PriorityFirstMethod(FirstMethod):
+    """
+    FirstMethod fed in any order: every pixel keeps the value of the asset first in mosaic order (lowest
+    `priority`) having one, so the mosaic is the one FirstMethod builds when fed in mosaic order. It is done
+    when it is filled and none of the assets not fed yet (`unresolved`, the lowest of their priorities) comes
+    before the assets the pixels were taken from.
+    """
+
+    # priority of the next array fed
+    priority: int = field(default=0, init=False)
+    unresolved: int = field(default=0, init=False)
+    ranks: Optional[numpy.ndarray] = field(default=None, init=False)
+
+    def __repr__(self):
+        return "<Mosaic: FirstMethod>"
+
+    def feed(self, array: numpy.ma.MaskedArray):
+        valid = ~numpy.ma.getmaskarray(array)
+        if self.mosaic is None:
+            self.mosaic = array
+            self.ranks = numpy.where(valid, self.priority, numpy.iinfo("int64").max)
+            return
+        take = valid & (self.priority < self.ranks)
+        mask = numpy.where(take, False, numpy.ma.getmaskarray(self.mosaic))
+        self.mosaic = numpy.ma.where(take, array, self.mosaic)
+        self.mosaic.mask = mask
+        self.ranks = numpy.where(take, self.priority, self.ranks)
+
+    @property
+    def is_done(self) -> bool:
+        if not super().is_done:
+            return False
+        ranks = self.ranks[~numpy.ma.getmaskarray(self.mosaic)]
+        return not ranks.size or ranks.max() < self.unresolved
+
+
+def scheduled_mosaic_reader(
+        mosaic_assets: Sequence[str],
+        reader: Callable[..., ImageData],
+        *args: Any,
+        pixel_selection: MosaicMethodBase = None,
+        coverage: Dict[str, int] = None,
+        threads: int = MOSAIC_REQUEST_CONCURRENCY,
+        allowed_exceptions: Tuple = (TileOutsideBounds,),
+        **kwargs: Any,
+) -> Tuple[ImageData, List[str]]:
+    """
+    Drop-in replacement for rio_tiler's `mosaic_reader` that reads the assets concurrently
+    on the shared pool and stops reading as soon as the pixel selection is done.
+
+    Reads are started in coverage order (largest first) so the assets most likely to fill
+    the tile are fetched first, and every image is fed to the pixel selection method as soon as
+    it is read. The default FirstMethod is replaced by PriorityFirstMethod, which keeps the
+    mosaic order whatever the order the reads complete in, so the output is identical to the
+    sequential reader. The reads still in flight are cancelled once the pixel selection is done.
+
+    Args:
+        mosaic_assets (Sequence[str]): assets in mosaic (priority) order
+        reader (Callable): function taking `(asset, *args, **kwargs)` and returning an ImageData
+        pixel_selection (MosaicMethodBase, optional): pixel selection instance. Defaults to FirstMethod.
+        coverage (Dict[str, int], optional): relative coverage of the tile by each asset
+        threads (int, optional): max number of reads in flight for this request
+        allowed_exceptions (Tuple, optional): reader exceptions that are ignored
+
+    Returns:
+        Tuple[ImageData, List[str]]: the mosaic image and the assets used to create it, in mosaic order
+    """
+    if pixel_selection is None or type(pixel_selection) is FirstMethod:
+        pixel_selection = PriorityFirstMethod()
+    coverage = coverage or {}
+    threads = max(1, min(threads, MOSAIC_GLOBAL_CONCURRENCY))
+
+    priority = {asset: i for i, asset in enumerate(mosaic_assets)}
+    schedule = sorted(mosaic_assets, key=lambda a: (-coverage.get(a, 0), priority[a]))
+
+    executor = get_executor()
+    pending: Dict[futures.Future, str] = {}
+    unresolved = set(mosaic_assets)
+    assets_used: List[str] = []
+    image_props = None
+
+    def submit_next():
+        while schedule and len(pending) < threads:
+            asset = schedule.pop(0)
+            pending[executor.submit(reader, asset, *args, **kwargs)] = asset
+
+    def feed(asset: str, img: ImageData):
+        nonlocal image_props
+        if image_props is None:
+            image_props = img.crs, img.bounds, img.band_names
+            pixel_selection.cutline_mask = img.cutline_mask
+            pixel_selection.width = img.width
+            pixel_selection.height = img.height
+            pixel_selection.count = img.count
+
+        assert img.count == pixel_selection.count, "Assets HAVE TO have the same number of bands"
+        if isinstance(pixel_selection, PriorityFirstMethod):
+            pixel_selection.priority = priority[asset]
+        if img.width != pixel_selection.width or img.height != pixel_selection.height:
+            warnings.warn(
+                "Cannot concatenate images with different size. Will resize using fist asset width/heigh",
+                UserWarning,
+            )
+            h, w = pixel_selection.height, pixel_selection.width
+            pixel_selection.feed(
+                numpy.ma.MaskedArray(
+                    resize_array(img.array.data, h, w),
+                    mask=resize_array(img.array.mask * 1, h, w).astype("bool"),
+                )
+            )
+        else:
+            pixel_selection.feed(img.array)
+        assets_used.append(asset)
+
+    try:
+        submit_next()
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                asset = pending.pop(future)
+                unresolved.discard(asset)
+                try:
+                    img = future.result()
+                except allowed_exceptions as err:
+                    logger.info(err)
+                    continue
+                feed(asset, img)
+
+            if isinstance(pixel_selection, PriorityFirstMethod):
+                pixel_selection.unresolved = min((priority[a] for a in unresolved), default=len(mosaic_assets))
+            if pixel_selection.is_done and pixel_selection.data is not None:
+                break
+            submit_next()
+    finally:
+        # outstanding reads are not needed anymore, whatever the reason we leave
+        for future in pending:
+            future.cancel()
+
+    if pixel_selection.data is None:
+        raise EmptyMosaicError("Method returned an empty array")
+
+    assets_used.sort(key=priority.get)
+    crs, bounds, band_names = image_props
+    method = FirstMethod if isinstance(pixel_selection, PriorityFirstMethod) else type(pixel_selection)
+    return (
+        ImageData(
+            pixel_selection.data,
+            assets=assets_used,
+            crs=crs,
+            bounds=bounds,
+            band_names=band_names,
+            metadata={
+                "mosaic_method": method.__name__,
+                "mosaic_assets_count": len(mosaic_assets),
+                "mosaic_assets_used": len(assets_used),
+            },
+        ),
+        assets_used,
+    )
+
+
+class ScheduledMosaicBackend:
+    """
+    Wraps the cogeo-mosaic backend selected for the input (see `cogeo_mosaic.backends.MosaicBackend`)
+    and replaces its `tile` method with one using `scheduled_mosaic_reader`.
+    Everything else is delegated to the wrapped backend.
+    """
+
+    def __init__(self, input: str, *args, **kwargs):
+        self.backend = MosaicBackend(input, *args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self.backend, item)
+
+    def __enter__(self):
+        self.backend.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.backend.__exit__(exc_type, exc_value, traceback)
+
+    def asset_coverage(self, x: int, y: int, z: int) -> Dict[str, int]:
+        """
+        Number of mosaic quadkeys, under the tile, each asset is listed in.
+        A cheap proxy for the share of the tile an asset covers that needs no dataset read
+        """
+        if self.tms != (self.mosaic_def.tilematrixset or WEB_MERCATOR_TMS):
+            return {}
+        quadkeys = self.find_quadkeys(Tile(x=x, y=y, z=z), self.quadkey_zoom)
+        prefix = self.mosaic_def.asset_prefix or ""
+        return Counter(
+            prefix + asset for qk in quadkeys for asset in self.mosaic_def.tiles.get(qk, [])
+        )
+
+    def tile(self, x: int, y: int, z: int, reverse: bool = False, threads: int = None, **kwargs: Any):
+        """
+        Get Tile from multiple observation.
+        `threads` as passed by titiler's MosaicTilerFactory (RIO_TILER_MAX_THREADS) is superseded
+        by MOSAIC_REQUEST_CONCURRENCY
+        """
+        mosaic_assets = self.assets_for_tile(x, y, z)
+        if not mosaic_assets:
+            raise NoAssetFoundError(f"No assets found for tile {z}-{x}-{y}")
+
+        if reverse:
+            mosaic_assets = list(reversed(mosaic_assets))
+
+        def _reader(asset: str, x: int, y: int, z: int, **kwargs: Any) -> ImageData:
+            with self.reader(asset, tms=self.tms, **self.reader_options) as src_dst:
+                return src_dst.tile(x, y, z, **kwargs)
+
+        return scheduled_mosaic_reader(
+            mosaic_assets, _reader, x, y, z,
+            coverage=self.asset_coverage(x, y, z),
+            **kwargs
+        )
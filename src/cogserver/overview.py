@@ -0,0 +1,120 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+from fastapi import Depends, Request
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
+from rio_tiler.utils import resize_array
+from titiler.core.dependencies import TileParams
+
+from cogserver.algorithms import algorithms
+
+# tiles up to this zoom are processed at the coarsest resolution the algorithm accepts: the read is
+# divided by 2 at this zoom, by 4 one zoom below... down to the `input_max_downsample` of the algorithm
+ALGORITHM_OVERVIEW_MAX_ZOOM = int(os.getenv("ALGORITHM_OVERVIEW_MAX_ZOOM", 6))
+
+# one callable shared by the tile and process dependencies, so FastAPI builds the algorithm once per request
+algorithm_dependency = algorithms.dependency
+
+
+def downsample_factor(algorithm, z: Optional[int]) -> int:
+    """
+    Factor (a power of 2) by which a zoom `z` tile can be read smaller than requested before running the
+    algorithm, from the `input_max_downsample` it declares (1, the full tile resolution, when it declares none)
+    """
+    max_downsample = getattr(algorithm, "input_max_downsample", None) or 1
+    if z is None or z > ALGORITHM_OVERVIEW_MAX_ZOOM or max_downsample < 2:
+        return 1
+    return min(2 ** int(math.log2(max_downsample)), 2 ** (ALGORITHM_OVERVIEW_MAX_ZOOM + 1 - z))
+
+
+def requested_tilesize(request: Request) -> int:
+    """Size of the tile titiler reads for a tile request (256 pixels times the `@{scale}x` or `scale` scale)"""
+    return int(request.path_params.get("scale") or request.query_params.get("scale") or 1) * 256
+
+
+def tile_downsample(algorithm, z: Optional[int], buffered: bool = False) -> Optional[int]:
+    """Downsample factor of a zoom `z` tile, None when it is read at full resolution (always for buffered tiles)"""
+    if algorithm is None or z is None or buffered:
+        return None
+    factor = downsample_factor(algorithm, int(z))
+    return factor if factor > 1 else None
+
+
+def requested_downsample(request: Request, algorithm) -> Optional[int]:
+    """Downsample factor of a tile request, None for the other routes and the buffered or padded tiles"""
+    buffered = bool(request.query_params.get("buffer") or request.query_params.get("padding"))
+    return tile_downsample(algorithm, request.path_params.get("z"), buffered)
+
+
+@dataclass
+class OverviewTileParams(TileParams):
+    """Tile options with the factor the tile is read smaller by (`OverviewReader.tile`)"""
+
+    downsample: Optional[int] = None
+
+
+def overview_tile_params(
+    request: Request,
+    tile_params: TileParams = Depends(),
+    algorithm=Depends(algorithm_dependency),
+) -> OverviewTileParams:
+    return OverviewTileParams(
+        buffer=tile_params.buffer,
+        padding=tile_params.padding,
+        downsample=requested_downsample(request, algorithm),
+    )
+
+
+def resized(img: ImageData, height: int, width: int, resampling_method: str = "nearest") -> ImageData:
+    """ImageData.resize resampling the mask with nearest, so the resampled nodata edges stay sharp"""
+    data = resize_array(img.array.data, height, width, resampling_method)
+    mask = resize_array(numpy.ma.getmaskarray(img.array).astype("uint8"), height, width, "nearest").astype("bool")
+    return ImageData(
+        numpy.ma.MaskedArray(data, mask=mask),
+        assets=img.assets,
+        crs=img.crs,
+        bounds=img.bounds,
+        band_names=img.band_names,
+        metadata=img.metadata,
+        dataset_statistics=img.dataset_statistics,
+    )
+
+
+def upsampled(algorithm, tilesize: int):
+    """The algorithm with its output upsampled to `tilesize` (with the `output_resampling` it declares)"""
+
+    def process(img: ImageData) -> ImageData:
+        out = algorithm(img)
+        resampling = getattr(algorithm, "output_resampling", None) or "nearest"
+        return resized(out, tilesize, tilesize, resampling_method=resampling)
+
+    return process
+
+
+def tile_process(algorithm, downsample: Optional[int], tilesize: int):
+    """Post process of a tile read `downsample` times smaller: the algorithm, upsampled to `tilesize` if downsampled"""
+    if not downsample:
+        return algorithm
+    return upsampled(algorithm, tilesize)
+
+
+def overview_process(request: Request, algorithm=Depends(algorithm_dependency)):
+    """
+    Algorithm dependency running the algorithm on the downsampled tiles and upsampling its output
+    to the requested tile size for display
+    """
+    return tile_process(algorithm, requested_downsample(request, algorithm), requested_tilesize(request))
+
+
+class OverviewReader(Reader):
+    """rio-tiler Reader reading the tiles `downsample` times smaller, from the matching coarser overview"""
+
+    def tile(self, tile_x: int, tile_y: int, tile_z: int, tilesize: int = 256, downsample: Optional[int] = None,
+             **kwargs) -> ImageData:
+        if downsample and downsample > 1:
+            tilesize = max(tilesize // downsample, 1)
+        return super().tile(tile_x, tile_y, tile_z, tilesize=tilesize, **kwargs)
@@ -0,0 +1,124 @@
+import contextlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import attr
+import rasterio
+from rio_tiler.io import Reader
+
+from cogserver.dependencies import dataset_identity
+
+logger = logging.getLogger(__name__)
+
+# GDAL defaults, used to estimate the number of range requests an open costs without a learned size
+DEFAULT_INGESTED_BYTES = int(os.getenv("GDAL_INGESTED_BYTES_AT_OPEN", 16384))
+CURL_CHUNK_SIZE = int(os.getenv("CPL_VSIL_CURL_CHUNK_SIZE", 16384))
+
+HEADER_PREFETCH_CACHE_SIZE = int(os.getenv("HEADER_PREFETCH_CACHE_SIZE", 10000))
+HEADER_PREFETCH_MAX_BYTES = int(os.getenv("HEADER_PREFETCH_MAX_BYTES", 16 * 1024 * 1024))
+
+
+def header_size(src) -> Optional[int]:
+    """
+    Number of bytes holding the TIFF header, all the IFDs and their tile offset/bytecount arrays.
+
+    In a COG this metadata sits before the first tile of imagery, so its extent is the lowest block offset
+    over the full resolution and overview IFDs. None when the dataset is not a TIFF or its layout
+    does not keep the IFDs ahead of the imagery (a single read would not cover them).
+    """
+    if src.driver != "GTiff":
+        return None
+    first_block = ifd_end = None
+    for ovr in [None] + list(range(len(src.overviews(1)))):
+        offset = src.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1, ovr=ovr)
+        ifd = src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1, ovr=ovr)
+        if offset is None or ifd is None:
+            return None
+        first_block = int(offset) if first_block is None else min(first_block, int(offset))
+        ifd_end = int(ifd) if ifd_end is None else max(ifd_end, int(ifd))
+    if ifd_end >= first_block:
+        return None
+    return first_block
+
+
+def round_trips(size: int, ingested: int = DEFAULT_INGESTED_BYTES) -> int:
+    """
+    Estimated number of range requests GDAL needs to read `size` header bytes when it ingests `ingested` bytes at open
+    and then reads ahead `CURL_CHUNK_SIZE` chunks, doubling the read-ahead for sequential reads.
+    """
+    if size <= ingested:
+        return 1
+    return 1 + math.ceil(math.log2((size - ingested) / CURL_CHUNK_SIZE + 1))
+
+
+class HeaderSizeCache:
+    """LRU of the learned header size of the datasets, keyed by their token-agnostic identity"""
+
+    def __init__(self, maxsize: int = HEADER_PREFETCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.sizes: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.opens = 0
+        self.prefetched_opens = 0
+        self.round_trips_saved = 0
+
+    def get(self, url: str) -> Optional[int]:
+        key = dataset_identity(url)
+        with self.lock:
+            self.opens += 1
+            size = self.sizes.get(key)
+            if size is not None:
+                self.sizes.move_to_end(key)
+                self.prefetched_opens += 1
+                self.round_trips_saved += round_trips(size) - 1
+            return size
+
+    def learn(self, url: str, src):
+        try:
+            size = header_size(src)
+        except Exception as e:
+            logger.debug(f"Could not read the header layout of {dataset_identity(url)}: {e}")
+            return
+        if size is None:
+            return
+        # whole curl chunks, so the following block reads are aligned with GDAL's cache
+        size = min(math.ceil(size / CURL_CHUNK_SIZE) * CURL_CHUNK_SIZE, HEADER_PREFETCH_MAX_BYTES)
+        with self.lock:
+            self.sizes[dataset_identity(url)] = size
+            if len(self.sizes) > self.maxsize:
+                self.sizes.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "datasets": len(self.sizes),
+                "opens": self.opens,
+                "prefetched_opens": self.prefetched_opens,
+                "round_trips_saved": self.round_trips_saved,
+                "round_trips_saved_per_open": round(self.round_trips_saved / self.opens, 3) if self.opens else 0,
+            }
+
+
+header_sizes = HeaderSizeCache()
+
+
+@attr.s
+class HeaderPrefetchReader(Reader):
+    """
+    rio-tiler Reader opening the datasets with GDAL_INGESTED_BYTES_AT_OPEN set to the header size learned
+    the first time the dataset was opened, so GDAL gets the whole header in a single range request
+    """
+
+    def __attrs_post_init__(self):
+        if not self.dataset and self.input:
+            size = header_sizes.get(self.input)
+            env = rasterio.Env(GDAL_INGESTED_BYTES_AT_OPEN=size) if size else contextlib.nullcontext()
+            with env:
+                self.dataset = self._ctx_stack.enter_context(rasterio.open(self.input))
+            if size is None:
+                header_sizes.learn(self.input, self.dataset)
+        super().__attrs_post_init__()
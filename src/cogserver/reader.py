@@ -0,0 +1,15 @@
+import attr
+
+from cogserver.expression import ExpressionReader
+from cogserver.overview import OverviewReader
+from cogserver.prefetch import HeaderPrefetchReader
+
+
+@attr.s
+class CogReader(HeaderPrefetchReader, OverviewReader, ExpressionReader):
+    """
+    Dataset reader of the /cog and /vrt factories:
+        - the headers are fetched in one request using the learned per dataset size (HeaderPrefetchReader)
+        - low zoom tiles of algorithms are read from coarser overviews (OverviewReader)
+        - expressions are evaluated with compiled and cached programs (ExpressionReader)
+    """
@@ -0,0 +1,221 @@
+"""
+Materialize the tiles of a dataset into a local MBTiles archive.
+
+    python -m cogserver.seed --url https://.../dataset.tif?token --bbox -10 5 10 20 \
+        --minzoom 0 --maxzoom 8 --rescale 0,100 --colormap-name viridis --output /tmp/tiles/layer.mbtiles
+
+The tiles are rendered by the reader/algorithm/rescale/colormap pipeline of the `/cog` tile endpoint
+and can be served by the `/archive/{name}/tiles/{z}/{x}/{y}` endpoint.
+Seeding is resumable, tiles already present in the archive (or recorded as empty) are skipped.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent import futures
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import morecantile
+import rasterio
+from rio_tiler.errors import TileOutsideBounds
+from titiler.core.resources.enums import ImageType
+
+from cogserver.algorithms import algorithms
+from cogserver.archive import MBTilesArchive
+from cogserver.dependencies import parse_signed_url
+from cogserver.overview import algorithm_dependency, tile_downsample, tile_process
+from cogserver.server import cog
+
+logger = logging.getLogger(__name__)
+
+WEB_MERCATOR_TMS = morecantile.tms.get("WebMercatorQuad")
+
+
+def render_tile(z: int, x: int, y: int, options: Dict) -> Optional[bytes]:
+    """
+    Render one tile like `/cog/tiles/WebMercatorQuad/{z}/{x}/{y}` would, with the reader, GDAL environment and
+    rendering dependencies of the `/cog` factory and its overview downsampling of the algorithms.
+
+    Args:
+        z, x, y (int): tile index
+        options (Dict): url, bidx, expression, algorithm, algorithm_params, rescale, colormap_name, format, tilesize
+
+    Returns:
+        Optional[bytes]: the encoded tile or None when the tile holds no valid pixels
+    """
+    tilesize = options.get("tilesize", 256)
+    algorithm = algorithm_dependency(
+        algorithm=options.get("algorithm"),
+        algorithm_params=options.get("algorithm_params"),
+    )
+    downsample = tile_downsample(algorithm, z)
+    post_process = tile_process(algorithm, downsample, tilesize)
+    layer_params = cog.layer_dependency(indexes=options.get("bidx"), expression=options.get("expression"))
+    colormap = cog.colormap_dependency(colormap_name=options.get("colormap_name"))
+    render_params = cog.render_dependency(rescale=options.get("rescale"))
+
+    try:
+        with rasterio.Env(**cog.environment_dependency()):
+            with cog.reader(options["url"], tms=WEB_MERCATOR_TMS) as src_dst:
+                image = src_dst.tile(
+                    x, y, z, tilesize=tilesize, downsample=downsample, **layer_params.as_dict(),
+                )
+                dst_colormap = getattr(src_dst, "colormap", None)
+    except TileOutsideBounds:
+        return None
+
+    if not image.mask.any():
+        return None
+
+    if post_process:
+        image = post_process(image)
+
+    content, _ = cog.render_func(
+        image,
+        output_format=ImageType[options.get("format", "png")],
+        colormap=colormap or dst_colormap,
+        **render_params.as_dict(),
+    )
+    return content
+
+
+def render_tiles(tiles: List[Tuple[int, int, int]], options: Dict) -> List[Tuple[int, int, int, Optional[bytes]]]:
+    """Render a batch of tiles inside a worker process"""
+    return [(z, x, y, render_tile(z, x, y, options)) for z, x, y in tiles]
+
+
+def pending_batches(archive: MBTilesArchive, bbox: Tuple[float, float, float, float], minzoom: int, maxzoom: int,
+                    batch_size: int, skipped: List[int]) -> Iterator[List[Tuple[int, int, int]]]:
+    """Batches of the tiles not in the archive yet, zoom by zoom, counting the others in `skipped[0]`"""
+    batch = []
+    for z in range(minzoom, maxzoom + 1):
+        done = archive.existing(z)
+        for tile in WEB_MERCATOR_TMS.tiles(*bbox, zooms=[z]):
+            if (tile.x, tile.y) in done:
+                skipped[0] += 1
+                continue
+            batch.append((tile.z, tile.x, tile.y))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def seed(
+        output: str,
+        bbox: Tuple[float, float, float, float],
+        minzoom: int,
+        maxzoom: int,
+        options: Dict,
+        processes: int = os.cpu_count(),
+        batch_size: int = 64,
+):
+    """
+    Render all the tiles intersecting bbox between minzoom and maxzoom into the `output` MBTiles archive.
+    The batches are submitted as the previous ones complete, at most two per process are in flight.
+
+    Args:
+        output (str): MBTiles path, created if missing
+        bbox (Tuple[float, float, float, float]): west, south, east, north in EPSG:4326
+        minzoom (int): first zoom level
+        maxzoom (int): last zoom level
+        options (Dict): rendering options, see `render_tile`
+        processes (int, optional): number of rendering processes
+        batch_size (int, optional): number of tiles a process renders per task, also the commit interval
+
+    Returns:
+        Dict: seeding summary
+    """
+    with MBTilesArchive(output) as archive:
+        archive.set_metadata(
+            name=os.path.splitext(os.path.basename(output))[0],
+            format=options.get("format", "png"),
+            bounds=",".join(str(v) for v in bbox),
+            minzoom=minzoom,
+            maxzoom=maxzoom,
+            type="overlay",
+            source=json.dumps({k: v for k, v in options.items() if k != "url"}),
+        )
+
+        skipped = [0]
+        batches = pending_batches(archive, bbox, minzoom, maxzoom, batch_size, skipped)
+        rendered = empty = 0
+        start = time.monotonic()
+
+        def store(task: futures.Future):
+            nonlocal rendered, empty
+            results = task.result()
+            archive.put(results)
+            rendered += len(results)
+            empty += sum(1 for *_, data in results if data is None)
+            logger.info(f"{rendered} tiles, {rendered / (time.monotonic() - start):.1f} tiles/sec")
+
+        with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            in_flight = set()
+            for batch in batches:
+                in_flight.add(executor.submit(render_tiles, batch, options))
+                if len(in_flight) >= 2 * processes:
+                    done, in_flight = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                    for task in done:
+                        store(task)
+            for task in futures.as_completed(in_flight):
+                store(task)
+        logger.info(f"{rendered} tiles rendered, {skipped[0]} already in {output}")
+
+    elapsed = time.monotonic() - start
+    return {
+        "rendered": rendered,
+        "empty": empty,
+        "skipped": skipped[0],
+        "seconds": round(elapsed, 3),
+        "tiles_per_second": round(rendered / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m cogserver.seed", description=__doc__.split("\n")[1])
+    parser.add_argument("--url", required=True, help="Unsigned/signed dataset URL")
+    parser.add_argument("--output", required=True, help="MBTiles archive path")
+    parser.add_argument("--bbox", required=True, type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--minzoom", type=int, default=0)
+    parser.add_argument("--maxzoom", type=int, required=True)
+    parser.add_argument("--bidx", type=int, nargs="+", help="Dataset band indexes")
+    parser.add_argument("--expression", help="rio-tiler's band math expression")
+    parser.add_argument("--algorithm", choices=algorithms.list(), help="Algorithm name")
+    parser.add_argument("--algorithm-params", help="JSON encoded algorithm parameters")
+    parser.add_argument("--rescale", action="append", help="min,max rescale range, one per band")
+    parser.add_argument("--colormap-name", help="Colormap name")
+    parser.add_argument("--format", default="png", choices=[t.name for t in ImageType])
+    parser.add_argument("--tilesize", type=int, default=256)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=64)
+    opts = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    options = {
+        "url": parse_signed_url(url=opts.url),
+        "bidx": opts.bidx,
+        "expression": opts.expression,
+        "algorithm": opts.algorithm,
+        "algorithm_params": opts.algorithm_params,
+        "rescale": opts.rescale,
+        "colormap_name": opts.colormap_name,
+        "format": opts.format,
+        "tilesize": opts.tilesize,
+    }
+    summary = seed(
+        opts.output,
+        tuple(opts.bbox),
+        opts.minzoom,
+        opts.maxzoom,
+        options,
+        processes=opts.processes,
+        batch_size=opts.batch_size,
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,14 @@
+from contextlib import asynccontextmanager
 from typing import Annotated, Literal, Optional
 from titiler.application import main as default
 from cogserver.dependencies import SignedDatasetPath
 from cogserver.algorithms import algorithms
-from rio_tiler.io import STACReader
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 import logging
 import rasterio
 from fastapi import FastAPI, Query
-from titiler.core.factory import TilerFactory, MultiBaseTilerFactory, AlgorithmFactory, ColorMapFactory
+from titiler.core.factory import MultiBaseTilerFactory, AlgorithmFactory, ColorMapFactory
 from titiler.application import __version__ as titiler_version
 from titiler.core.models.OGC import Landing, Conformance
 from titiler.core.resources.enums import MediaType
@@ -20,14 +20,40 @@ from titiler.mosaic.errors import MOSAIC_STATUS_CODES
 from titiler.extensions.stac import stacExtension
 
 from cogserver.vrt import VRTFactory
+from cogserver.reader import CogReader
+from cogserver.statistics import StatisticsTilerFactory
+from cogserver.overview import overview_process, overview_tile_params
+from cogserver.prefetch import header_sizes
+from cogserver.stac import CachedSTACReader, stac_items
+from cogserver.memory import governor
+from cogserver.util import DEPENDENCY_INDEX_VALIDATE, dependency_index
+from cogserver.mosaic import ScheduledMosaicBackend
+from cogserver.archive import router as archive_router
 from cogserver.extensions.mosaicjson import MosaicJsonExtension
 from cogserver.extensions.vrt import VRTExtension
+from cogserver.extensions.materialize import MaterializeExtension
+from cogserver.extensions.points import PointsExtension
+from cogserver.extensions.zonal import ZonalStatisticsExtension
 
 logger = logging.getLogger(__name__)
 
 api_settings = default.api_settings
 
 #################################### APP ######################################
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # every gunicorn worker applies its share of the memory budget and watches its own RSS
+    governor.start()
+    # all the routers are included by now
+    index = dependency_index(app)
+    if DEPENDENCY_INDEX_VALIDATE:
+        logger.info(f"Route dependency index validated: {index.validate()}")
+    yield
+    governor.stop()
+
+
 app = FastAPI(
     title=api_settings.name,
     openapi_url="/api",
@@ -43,6 +69,7 @@ app = FastAPI(
 """,
     version=titiler_version,
     root_path=api_settings.root_path,
+    lifespan=lifespan,
 )
 
 # Fix OpenAPI response header for OGC Common compatibility
@@ -60,15 +87,20 @@ TITILER_CONFORMS_TO = {
 
 
 #################################### COG ######################################
-cog = TilerFactory(
+cog = StatisticsTilerFactory(
+    reader=CogReader,
     router_prefix="/cog",
     extensions=[
         # cogValidateExtension(),
         # cogViewerExtension(),
         stacExtension(),
+        MaterializeExtension(),
+        PointsExtension(),
+        ZonalStatisticsExtension(),
     ],
     path_dependency=SignedDatasetPath,
-    process_dependency=algorithms.dependency
+    tile_dependency=overview_tile_params,
+    process_dependency=overview_process
 )
 app.include_router(cog.router, prefix="/cog", tags=["Cloud Optimized GeoTIFF"])
 TITILER_CONFORMS_TO.update(cog.conforms_to)
@@ -79,6 +111,7 @@ TITILER_CONFORMS_TO.update(cog.conforms_to)
 
 mosaic = MosaicTilerFactory(
     router_prefix="/mosaicjson",
+    backend=ScheduledMosaicBackend,
     path_dependency=SignedDatasetPath,
     process_dependency=algorithms.dependency,
     extensions=[
@@ -95,7 +128,7 @@ TITILER_CONFORMS_TO.update(mosaic.conforms_to)
 # STAC endpoints
 
 stac = MultiBaseTilerFactory(
-    reader=STACReader,
+    reader=CachedSTACReader,
     router_prefix="/stac",
     extensions=[
         # stacViewerExtension(),
@@ -146,6 +179,13 @@ TITILER_CONFORMS_TO.update(vrt.conforms_to)
 ###############################################################################
 
 
+############################# Tile archives ###################################
+
+app.include_router(archive_router, prefix="/archive", tags=["Tile archives"])
+
+###############################################################################
+
+
 ############################# TileMatrixSets ##################################
 
 
@@ -174,7 +214,10 @@ def ping():
             "gdal": rasterio.__gdal_version__,
             "proj": rasterio.__proj_version__,
             "geos": rasterio.__geos_version__,
-        }
+        },
+        "header_prefetch": header_sizes.stats(),
+        "stac_items": stac_items.stats(),
+        "memory": governor.stats(),
     }
 
 
@@ -0,0 +1,233 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Dict, Optional, Type
+from urllib.parse import urlparse
+
+import attr
+import httpx
+import pystac
+from rio_tiler.errors import InvalidAssetName
+from rio_tiler.io import BaseReader, STACReader
+from rio_tiler.io.stac import aws_get_object
+from rio_tiler.types import AssetInfo
+
+from cogserver.reader import CogReader
+
+logger = logging.getLogger(__name__)
+
+# seconds a cached item is used without asking the server whether it changed
+STAC_CACHE_TTL = int(os.getenv("STAC_CACHE_TTL", 300))
+STAC_CACHE_SIZE = int(os.getenv("STAC_CACHE_SIZE", 1024))
+# assets of an item read at the same time (RIO_TILER_MAX_THREADS is kept at 1 for the other readers)
+STAC_ASSET_THREADS = int(os.getenv("STAC_ASSET_THREADS", 8))
+
+
+def object_size(obj: Any) -> int:
+    """Memory held by a parsed JSON document (dicts, lists, strings, numbers), in bytes"""
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, list):
+            stack.extend(obj)
+    return size
+
+
+def parse_item(data: Dict, url: str) -> Dict:
+    """Arguments of a CachedItem for a parsed item document, sized as parsed objects (several times the JSON)"""
+    return {"item": pystac.Item.from_dict(data, url), "size": object_size(data)}
+
+
+@attr.s(auto_attribs=True)
+class CachedItem:
+    item: pystac.Item
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: int = 0
+    checked: float = attr.ib(factory=time.monotonic)
+    assets: Dict[str, AssetInfo] = attr.ib(factory=dict)
+
+
+class STACItemCache:
+    """
+    LRU of parsed STAC items keyed by their full URL (like rio-tiler's fetch cache, an item fetched with a
+    SAS token is only served to requests with the same token), bounded by a number of items and, when
+    `maxbytes` is set (see cogserver.memory), by the memory of their parsed documents.
+
+    An item is served from memory for `ttl` seconds, then revalidated with a conditional request
+    (If-None-Match/If-Modified-Since) so an unchanged item costs a `304` and no JSON parsing.
+    Local items are revalidated with their modification time, S3 items are fetched again.
+    Concurrent misses of the same URL wait for a single fetch.
+    """
+
+    def __init__(self, maxsize: int = STAC_CACHE_SIZE, ttl: int = STAC_CACHE_TTL):
+        self.maxsize = maxsize
+        self.maxbytes: Optional[int] = None
+        self.nbytes = 0
+        self.ttl = ttl
+        self.items: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        # per URL fetch locks and the number of requests using them
+        self.fetching: Dict[str, list] = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.fetched = 0
+
+    def fetch(self, url: str, cached: Optional[CachedItem] = None, **kwargs) -> Optional[CachedItem]:
+        """Fetch the item at `url`, None when `cached` is still current"""
+        parsed = urlparse(url)
+        if parsed.scheme in ["https", "http", "ftp"]:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if cached and cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached and cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+            resp = httpx.get(url, headers=headers, **kwargs)
+            if resp.status_code == 304 and cached:
+                return None
+            resp.raise_for_status()
+            return CachedItem(
+                **parse_item(resp.json(), url),
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+            )
+
+        if parsed.scheme == "s3":
+            content = aws_get_object(parsed.netloc, parsed.path.strip("/"), **kwargs)
+            return CachedItem(**parse_item(json.loads(content), url))
+
+        last_modified = formatdate(os.path.getmtime(url), usegmt=True)
+        if cached and cached.last_modified == last_modified:
+            return None
+        with open(url, "rb") as f:
+            content = f.read()
+        return CachedItem(**parse_item(json.loads(content), url), last_modified=last_modified)
+
+    def current(self, url: str) -> Optional[CachedItem]:
+        """The cached item of `url` when checked less than `ttl` seconds ago, to call with the lock held"""
+        cached = self.items.get(url)
+        if cached and time.monotonic() - cached.checked < self.ttl:
+            self.items.move_to_end(url)
+            self.hits += 1
+            return cached
+        return None
+
+    def get(self, url: str, **kwargs) -> CachedItem:
+        with self.lock:
+            cached = self.current(url)
+            if cached:
+                return cached
+            fetching = self.fetching.setdefault(url, [threading.Lock(), 0])
+            fetching[1] += 1
+
+        try:
+            with fetching[0]:
+                with self.lock:
+                    # fetched by a concurrent request meanwhile
+                    cached = self.current(url)
+                    if cached:
+                        return cached
+                    cached = self.items.get(url)
+
+                fetched = self.fetch(url, cached, **kwargs)
+                with self.lock:
+                    if fetched is None:
+                        self.revalidated += 1
+                        cached.checked = time.monotonic()
+                        return cached
+
+                    self.fetched += 1
+                    if url in self.items:
+                        self.nbytes -= self.items[url].size
+                    self.items[url] = fetched
+                    self.items.move_to_end(url)
+                    self.nbytes += fetched.size
+                    while len(self.items) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                        self.nbytes -= self.items.popitem(last=False)[1].size
+                return fetched
+        finally:
+            with self.lock:
+                fetching[1] -= 1
+                if not fetching[1]:
+                    del self.fetching[url]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "items": len(self.items),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "fetched": self.fetched,
+            }
+
+
+stac_items = STACItemCache()
+
+
+def with_asset_threads(method):
+    """Read the assets of a MultiBaseReader method concurrently (`threads` is consumed by rio-tiler's tasks)"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        kwargs.setdefault("threads", STAC_ASSET_THREADS)
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+@attr.s
+class CachedSTACReader(STACReader):
+    """
+    STACReader of the /stac factory:
+        - the item is taken from the `stac_items` cache instead of being fetched and parsed on every request
+        - the asset infos are computed once per item version
+        - the assets are opened with CogReader, so their headers come in one request of the learned size
+        - the assets of a request are read concurrently (STAC_ASSET_THREADS)
+    """
+
+    reader: Type[BaseReader] = attr.ib(default=CogReader)
+
+    _cached: CachedItem = attr.ib(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        if not self.item:
+            self._cached = stac_items.get(self.input, **self.fetch_options)
+            self.item = self._cached.item
+        super().__attrs_post_init__()
+
+    def _get_asset_info(self, asset: str) -> AssetInfo:
+        if self._cached is None:
+            return super()._get_asset_info(asset)
+        # the assets of the reader (include_assets/exclude_assets) are checked before the cache
+        name, _ = self._parse_vrt_asset(asset)
+        if name not in self.assets:
+            raise InvalidAssetName(f"'{name}' is not valid, should be one of {self.assets}")
+        info = self._cached.assets.get(asset)
+        if info is None:
+            info = self._cached.assets[asset] = super()._get_asset_info(asset)
+        return dict(info)
+
+    info = with_asset_threads(STACReader.info)
+    statistics = with_asset_threads(STACReader.statistics)
+    tile = with_asset_threads(STACReader.tile)
+    part = with_asset_threads(STACReader.part)
+    preview = with_asset_threads(STACReader.preview)
+    point = with_asset_threads(STACReader.point)
+    feature = with_asset_threads(STACReader.feature)
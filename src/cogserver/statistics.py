@@ -0,0 +1,227 @@
+import copy
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from typing import Dict, List, Optional, Sequence
+from xml.etree import ElementTree as ET
+
+import rasterio
+from attrs import define
+from fastapi import Depends
+from fastapi.routing import APIRoute
+from rio_tiler.io import Reader
+from rio_tiler.models import BandStatistics
+from titiler.core.factory import TilerFactory
+from titiler.core.models.responses import Statistics
+from titiler.core.resources.responses import JSONResponse
+
+from cogserver.dependencies import dataset_identity
+
+logger = logging.getLogger(__name__)
+
+# same decimated read as the default `/statistics` request, so both give the same results
+STATISTICS_MAX_SIZE = int(os.getenv("STATISTICS_MAX_SIZE", 1024))
+STATISTICS_PERCENTILES = [int(p) for p in os.getenv("STATISTICS_PERCENTILES", "2,98").split(",")]
+STATISTICS_THREADS = int(os.getenv("STATISTICS_THREADS", 8))
+STATISTICS_CACHE_SIZE = int(os.getenv("STATISTICS_CACHE_SIZE", 4096))
+
+# BandStatistics fields stored as STATISTICS_* band metadata, with GDAL's names where GDAL has one
+METADATA_KEYS = {
+    "min": "STATISTICS_MINIMUM",
+    "max": "STATISTICS_MAXIMUM",
+    "mean": "STATISTICS_MEAN",
+    "std": "STATISTICS_STDDEV",
+    "valid_percent": "STATISTICS_VALID_PERCENT",
+    "count": "STATISTICS_COUNT",
+    "sum": "STATISTICS_SUM",
+    "median": "STATISTICS_MEDIAN",
+    "majority": "STATISTICS_MAJORITY",
+    "minority": "STATISTICS_MINORITY",
+    "unique": "STATISTICS_UNIQUE",
+    "masked_pixels": "STATISTICS_MASKED_PIXELS",
+    "valid_pixels": "STATISTICS_VALID_PIXELS",
+}
+
+
+class BandStatisticsCache:
+    """LRU of the statistics of VRT bands keyed by their token-agnostic definition (`band_key`)"""
+
+    def __init__(self, maxsize: int = STATISTICS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.statistics: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[BandStatistics]:
+        with self.lock:
+            stats = self.statistics.get(key)
+            if stats is not None:
+                self.statistics.move_to_end(key)
+            return stats
+
+    def put(self, key: str, stats: BandStatistics):
+        with self.lock:
+            self.statistics[key] = stats
+            if len(self.statistics) > self.maxsize:
+                self.statistics.popitem(last=False)
+
+
+band_statistics_cache = BandStatisticsCache()
+
+
+def band_key(vrt: ET.Element, band: ET.Element) -> str:
+    """
+    Definition of a VRT band (grid, data type, nodata, sources and their nodata) with the source URLs
+    without their SAS token, so the same band of a VRT signed with other tokens has the same key
+    """
+    band = copy.deepcopy(band)
+    for filename in band.iter("SourceFilename"):
+        filename.text = dataset_identity(filename.text or "")
+    definition = [vrt.get("rasterXSize"), vrt.get("rasterYSize"), vrt.findtext("GeoTransform"),
+                  ET.tostring(band, encoding="unicode")]
+    return hashlib.sha1("|".join(str(part) for part in definition).encode()).hexdigest()
+
+
+def vrt_statistics(vrt: ET.Element) -> List[Optional[BandStatistics]]:
+    """
+    Statistics of every band of a VRT (without STATISTICS_* metadata yet), read through the VRT itself so its
+    nodata and data type apply, on a `STATISTICS_MAX_SIZE` read served by the sources overviews. The bands
+    are read concurrently and cached, None for the bands that could not be read.
+    """
+    xml = ET.tostring(vrt, encoding="unicode")
+    bands = vrt.findall("VRTRasterBand")
+
+    def task(bidx: int, band: ET.Element) -> Optional[BandStatistics]:
+        key = band_key(vrt, band)
+        stats = band_statistics_cache.get(key)
+        if stats is not None:
+            return stats
+        try:
+            with Reader(xml) as src:
+                stats = src.statistics(indexes=bidx, max_size=STATISTICS_MAX_SIZE,
+                                       percentiles=STATISTICS_PERCENTILES)[f"b{bidx}"]
+        except Exception as e:
+            logger.warning(f"Could not compute the statistics of the VRT band {bidx}: {e}")
+            return None
+        band_statistics_cache.put(key, stats)
+        return stats
+
+    with futures.ThreadPoolExecutor(max_workers=STATISTICS_THREADS) as executor:
+        return list(executor.map(task, range(1, len(bands) + 1), bands))
+
+
+def statistics_metadata(stats: BandStatistics, max_size: int = STATISTICS_MAX_SIZE) -> Dict[str, str]:
+    """STATISTICS_* band metadata of a BandStatistics computed on a `max_size` read"""
+    metadata = {key: repr(float(getattr(stats, field))) for field, key in METADATA_KEYS.items()}
+    metadata["STATISTICS_MAX_SIZE"] = str(max_size)
+    for name, value in stats.model_extra.items():
+        if name.startswith("percentile_"):
+            metadata[f"STATISTICS_{name.upper()}"] = repr(float(value))
+    counts, edges = stats.histogram
+    metadata["STATISTICS_HISTOBINVALUES"] = "|".join(str(int(c)) for c in counts) + "|"
+    metadata["STATISTICS_HISTOMIN"] = repr(float(edges[0]))
+    metadata["STATISTICS_HISTOMAX"] = repr(float(edges[-1]))
+    metadata["STATISTICS_HISTONUMBINS"] = str(len(counts))
+    # the exact edges, numpy computes them in the data type
+    metadata["STATISTICS_HISTOBINEDGES"] = "|".join(repr(float(e)) for e in edges) + "|"
+    return metadata
+
+
+def statistics_from_metadata(tags: Dict[str, str], percentiles: Sequence[int], bins: int = 10,
+                             max_size: int = STATISTICS_MAX_SIZE) -> Optional[BandStatistics]:
+    """
+    BandStatistics from STATISTICS_* band metadata, None when some of them (or of the percentiles) are missing,
+    they were not computed on a `max_size` read or the histogram does not have `bins` bins
+    """
+    keys = list(METADATA_KEYS.values()) + [f"STATISTICS_PERCENTILE_{p}" for p in percentiles]
+    keys += ["STATISTICS_HISTOBINVALUES", "STATISTICS_HISTOBINEDGES"]
+    if not all(key in tags for key in keys) or tags.get("STATISTICS_MAX_SIZE") != str(max_size):
+        return None
+    counts = [int(c) for c in tags["STATISTICS_HISTOBINVALUES"].split("|") if c]
+    if len(counts) != bins:
+        return None
+    edges = [float(e) for e in tags["STATISTICS_HISTOBINEDGES"].split("|") if e]
+    return BandStatistics(
+        **{field: float(tags[key]) for field, key in METADATA_KEYS.items()},
+        **{f"percentile_{p}": float(tags[f"STATISTICS_PERCENTILE_{p}"]) for p in percentiles},
+        histogram=[counts, edges],
+    )
+
+
+def embedded_statistics(dataset, indexes: Optional[Sequence[int]], percentiles: Sequence[int],
+                        bins: int = 10, max_size: int = STATISTICS_MAX_SIZE) -> Optional[Dict]:
+    """Statistics of the bands from their metadata, None unless all the bands have them (for a `max_size` read)"""
+    statistics = {}
+    for bidx in indexes or dataset.indexes:
+        stats = statistics_from_metadata(dataset.tags(bidx), percentiles, bins, max_size)
+        if stats is None:
+            return None
+        statistics[f"b{bidx}"] = stats
+    return statistics
+
+
+@define(kw_only=True)
+class StatisticsTilerFactory(TilerFactory):
+    """
+    TilerFactory answering the `/statistics` requests without expression, algorithm, histogram range or
+    nodata options from the STATISTICS_* band metadata when the dataset has them for the requested `max_size`
+    (e.g. VRTs built with `statistics=true`), without reading the data.
+    """
+
+    def statistics(self):
+        super().statistics()
+        # titiler's GET route is replaced (same path, operation and documentation), its POST route is kept
+        self.router.routes[:] = [
+            route for route in self.router.routes
+            if not (isinstance(route, APIRoute) and route.path == "/statistics" and "GET" in route.methods)
+        ]
+
+        @self.router.get(
+            "/statistics",
+            response_class=JSONResponse,
+            response_model=Statistics,
+            responses={200: {"content": {"application/json": {}}, "description": "Return dataset's statistics."}},
+            operation_id=f"{self.operation_prefix}getStatistics",
+        )
+        def statistics(
+            src_path=Depends(self.path_dependency),
+            reader_params=Depends(self.reader_dependency),
+            layer_params=Depends(self.layer_dependency),
+            dataset_params=Depends(self.dataset_dependency),
+            image_params=Depends(self.img_preview_dependency),
+            post_process=Depends(self.process_dependency),
+            stats_params=Depends(self.stats_dependency),
+            histogram_params=Depends(self.histogram_dependency),
+            env=Depends(self.environment_dependency),
+        ):
+            """Get Dataset statistics."""
+            with rasterio.Env(**env):
+                with self.reader(src_path, **reader_params.as_dict()) as src_dst:
+                    layer = layer_params.as_dict()
+                    image_options = image_params.as_dict()
+                    hist_options = histogram_params.as_dict()
+                    if (
+                        not post_process
+                        and not layer.get("expression")
+                        and set(image_options) == {"max_size"}
+                        and not dataset_params.as_dict()
+                        and set(hist_options) <= {"bins"}
+                        and isinstance(hist_options.get("bins", 10), int)
+                        and not stats_params.categorical
+                    ):
+                        stats = embedded_statistics(
+                            src_dst.dataset,
+                            layer.get("indexes"),
+                            stats_params.percentiles or [2, 98],
+                            hist_options.get("bins", 10),
+                            image_options["max_size"],
+                        )
+                        if stats is not None:
+                            return stats
+
+                    image = src_dst.preview(**layer, **image_options, **dataset_params.as_dict())
+                    if post_process:
+                        image = post_process(image)
+                    return image.statistics(**stats_params.as_dict(), hist_options=hist_options)
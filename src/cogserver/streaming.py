@@ -0,0 +1,226 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+from cogeo_mosaic.mosaic import MosaicJSON
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: nocover
+    brotli = None
+
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+# brotli's default (11) is made for static assets, far too slow to compress a response while it is produced
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+# serialized text buffered before it is compressed and sent
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 64 * 1024))
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
+# seconds a cached response is served, the datasets it was built from are not checked for changes
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+# preferred first
+ENCODINGS = ["br", "gzip"] if brotli else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str] = ENCODINGS) -> str:
+    """Best of the `available` encodings accepted by an Accept-Encoding header, `identity` if none is"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+class Encoder:
+    """Incremental gzip/brotli compressor, pass through for `identity`"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = None
+
+    def compress(self, data: bytes) -> bytes:
+        if self._compressor is None:
+            return data
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self._compressor is None:
+            return b""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def decode(data: bytes, encoding: str) -> Iterator[bytes]:
+    """Decompress a cached response in chunks, for the clients not accepting its encoding"""
+    if encoding == "br":
+        decompressor = brotli.Decompressor()
+        for i in range(0, len(data), STREAM_CHUNK_SIZE):
+            yield decompressor.process(data[i:i + STREAM_CHUNK_SIZE])
+        return
+    decompressor = zlib.decompressobj(31)
+    for i in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield decompressor.decompress(data[i:i + STREAM_CHUNK_SIZE])
+    yield decompressor.flush()
+
+
+class ResponseCache:
+    """LRU of compressed response bodies, bounded in bytes, every body is served for `ttl` seconds"""
+
+    def __init__(self, maxbytes: int = RESPONSE_CACHE_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, bytes]]:
+        """(media type, encoding, body) cached for key, None once it has expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[3] >= self.ttl:
+                self.nbytes -= len(self.entries.pop(key)[2])
+                return None
+            self.entries.move_to_end(key)
+            return entry[:3]
+
+    def put(self, key: str, media_type: str, encoding: str, body: bytes):
+        if len(body) > self.maxbytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= len(self.entries.pop(key)[2])
+            self.entries[key] = (media_type, encoding, body, time.monotonic())
+            self.nbytes += len(body)
+            while self.nbytes > self.maxbytes:
+                self.nbytes -= len(self.entries.popitem(last=False)[1][2])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+response_cache = ResponseCache()
+
+
+def cache_key(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def encoded_headers(encoding: str) -> Dict[str, str]:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def cached_response(request: Request, key: str) -> Optional[Response]:
+    """Response for a cached body, decompressed on the fly if the client does not accept its encoding"""
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    media_type, encoding, body = entry
+    if negotiate_encoding(request.headers.get("accept-encoding", ""), [encoding]) == encoding:
+        return Response(body, media_type=media_type, headers=encoded_headers(encoding))
+    return StreamingResponse(decode(body, encoding), media_type=media_type, headers=encoded_headers("identity"))
+
+
+def buffered(chunks: Iterable[str], size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer).encode()
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def streaming_response(request: Request, chunks: Iterable[str], media_type: str,
+                       key: Optional[str] = None) -> StreamingResponse:
+    """
+    Stream the serialized `chunks` compressed with the best encoding accepted by the client.
+    When `key` is given the compressed body is also stored in the response cache (gzip compressed
+    for the clients accepting no encoding) once it has been sent completely.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    encoder = Encoder(encoding)
+    store = None
+    if key:
+        store = encoder if encoding != "identity" else Encoder("gzip")
+
+    def body():
+        stored = []
+        for data in buffered(chunks):
+            out = encoder.compress(data)
+            if store is encoder:
+                stored.append(out)
+            elif store:
+                stored.append(store.compress(data))
+            if out:
+                yield out
+        out = encoder.flush()
+        if store:
+            stored.append(out if store is encoder else store.flush())
+            response_cache.put(key, media_type, store.encoding, b"".join(stored))
+        if out:
+            yield out
+
+    # sync generators are iterated in the threadpool, the serialization does not block the event loop
+    return StreamingResponse(body(), media_type=media_type, headers=encoded_headers(encoding))
+
+
+def iter_mosaicjson(mosaic: MosaicJSON, quadkeys_per_chunk: int = 1000) -> Iterator[str]:
+    """JSON of a MosaicJSON (None fields excluded) serialized a few quadkeys at a time"""
+    header = json.dumps(mosaic.model_dump(mode="json", exclude={"tiles"}, exclude_none=True), separators=(",", ":"))
+    yield header[:-1] + ',"tiles":{'
+    tiles = iter(mosaic.tiles.items())
+    separator = ""
+    while chunk := dict(itertools.islice(tiles, quadkeys_per_chunk)):
+        # dumped together by the C encoder, without the braces
+        yield separator + json.dumps(chunk, separators=(",", ":"))[1:-1]
+        separator = ","
+    yield "}}"
+
+
+def iter_element(element: ET.Element) -> Iterator[str]:
+    """XML of an element serialized one child at a time"""
+    attributes = "".join(f" {name}={quoteattr(value)}" for name, value in element.attrib.items())
+    yield f"<{element.tag}{attributes}>"
+    if element.text:
+        yield escape(element.text)
+    for child in element:
+        yield ET.tostring(child, encoding="unicode")
+    yield f"</{element.tag}>"
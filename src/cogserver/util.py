@@ -1,43 +1,196 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Annotated, Callable, Dict, List, Optional, get_args, get_origin
+
 from fastapi import FastAPI
-from fastapi.dependencies.utils import get_parameterless_sub_dependant
-from fastapi import Depends
+from fastapi.dependencies.models import Dependant
+from fastapi.dependencies.utils import get_dependant
+
+logger = logging.getLogger(__name__)
+
+# compare the index with a scan of the routes and time both at startup
+DEPENDENCY_INDEX_VALIDATE = os.getenv("DEPENDENCY_INDEX_VALIDATE", "false").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class DependencySlot:
+    """Position of a dependency in the dependencies of a route (or of another dependency of the route)"""
+
+    route: object
+    parent: Dependant
+    position: int
+
+    @property
+    def dependant(self) -> Dependant:
+        return self.parent.dependencies[self.position]
+
+
+def iter_routes(routes):
+    for route in routes:
+        # recent FastAPI versions include the routers lazily, their routes get their own dependant per inclusion
+        if hasattr(route, "effective_candidates"):
+            yield from iter_routes(route.effective_candidates())
+        else:
+            yield route
+
+
+def iter_slots(app: FastAPI):
+    """(query parameter name, slot) of every dependency of every route, the nested dependencies included"""
+    for route in iter_routes(app.routes):
+        dependants = [getattr(route, "dependant", None)]
+        while dependants:
+            parent = dependants.pop()
+            if parent is None:
+                continue
+            for position, dependant in enumerate(parent.dependencies):
+                for param in dependant.query_params:
+                    yield param.name, DependencySlot(route, parent, position)
+                dependants.append(dependant)
+
+
+def scan_dependency(app: FastAPI, arg_name: str) -> Optional[Callable]:
+    """First dependency taking the `arg_name` query parameter, by scanning all the routes (what the index replaces)"""
+    for name, slot in iter_slots(app):
+        if name == arg_name:
+            return slot.dependant.call
+    return None
+
+
+def signature_of(call: Callable):
+    """(parameter kinds, names and types, return type) of a dependency, without the FastAPI metadata"""
+
+    def bare(annotation):
+        return get_args(annotation)[0] if get_origin(annotation) is Annotated else annotation
 
+    signature = inspect.signature(call)
+    params = [(p.kind, p.name, bare(p.annotation)) for p in signature.parameters.values()]
+    return params, bare(signature.return_annotation)
 
-def get_path_dependency(app:FastAPI=None, arg_name=None):
+
+class DependencyIndex:
+    """
+    Dependencies of the routes of an app indexed by the query parameters they take and by their callable, built once
+    after all the routers are included (routes added later need a `build`). Looking up the dependency taking a
+    parameter (e.g. the path dependency, taking `url`) is a dict access, and a dependency is swapped in all the
+    factories in one `replace` call.
     """
-    Extract the first dependency of any kind whose arg name is arg_name
-    Used  in conjunction
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.lock = threading.Lock()
+        self.slots: Dict[str, List[DependencySlot]] = {}
+        self.calls: Dict[Callable, List[DependencySlot]] = {}
+        self.build()
+
+    def build(self):
+        slots = defaultdict(list)
+        calls = defaultdict(list)
+        for name, slot in iter_slots(self.app):
+            slots[name].append(slot)
+            # a slot is yielded once per query parameter of the dependency
+            same_call = calls[slot.dependant.call]
+            if not same_call or same_call[-1].parent is not slot.parent or same_call[-1].position != slot.position:
+                same_call.append(slot)
+        self.slots = dict(slots)
+        self.calls = dict(calls)
+
+    def get(self, arg_name: str) -> Optional[Callable]:
+        """First dependency taking the `arg_name` query parameter"""
+        slots = self.slots.get(arg_name)
+        return slots[0].dependant.call if slots else None
+
+    def replace(self, replacements: Dict[Callable, Callable]) -> int:
+        """
+        Replace dependencies (keys) by new dependencies (values) in all the routes. The new dependencies must
+        have the signature and return type of the ones they replace, and every new dependant is built before
+        any route changes, so a failing replacement leaves all the routes unchanged. The routes are then switched
+        one after the other (not atomically), to do at startup. Returns the number of replacements.
+        """
+        for old_dependency, new_dependency in replacements.items():
+            if signature_of(new_dependency) != signature_of(old_dependency):
+                raise ValueError(
+                    f"{getattr(new_dependency, '__name__', new_dependency)} does not have the signature of "
+                    f"{getattr(old_dependency, '__name__', old_dependency)}: "
+                    f"{inspect.signature(new_dependency)} != {inspect.signature(old_dependency)}"
+                )
+        with self.lock:
+            dependencies = {}
+            count = 0
+            for old_dependency, new_dependency in replacements.items():
+                for slot in self.calls.get(old_dependency, []):
+                    old = slot.dependant
+                    new = get_dependant(path=old.path or slot.route.path_format, call=new_dependency, name=old.name,
+                                        use_cache=old.use_cache)
+                    if id(slot.parent) not in dependencies:
+                        dependencies[id(slot.parent)] = (slot.parent, list(slot.parent.dependencies))
+                    dependencies[id(slot.parent)][1][slot.position] = new
+                    count += 1
+            for parent, new_dependencies in dependencies.values():
+                parent.dependencies = new_dependencies
+            self.build()
+            self.app.openapi_schema = None
+        names = [getattr(old, "__name__", old) for old in replacements]
+        logger.info(f"Replaced {count} route dependencies {names}")
+        return count
+
+    def validate(self, lookups: int = 100) -> Dict:
+        """Compare the lookups of the index with scans of the routes (raises on a mismatch) and time both"""
+        start = time.perf_counter()
+        DependencyIndex(self.app)
+        build = time.perf_counter() - start
+        names = list(self.slots)
+        for name in names:
+            if self.get(name) is not scan_dependency(self.app, name):
+                raise RuntimeError(f"Dependency index mismatch for {name!r}")
+        timings = {}
+        for label, lookup in (("index", self.get), ("scan", lambda name: scan_dependency(self.app, name))):
+            start = time.perf_counter()
+            for _ in range(lookups):
+                for name in names:
+                    lookup(name)
+            timings[label] = (time.perf_counter() - start) / (lookups * max(len(names), 1))
+        return {
+            "routes": len(list(iter_routes(self.app.routes))),
+            "parameters": len(names),
+            "slots": sum(len(slots) for slots in self.slots.values()),
+            "build_ms": round(build * 1000, 3),
+            "index_lookup_us": round(timings["index"] * 1e6, 3),
+            "scan_lookup_us": round(timings["scan"] * 1e6, 3),
+        }
+
+
+def dependency_index(app: FastAPI) -> DependencyIndex:
+    """The dependency index of the app, built on the first call"""
+    index = getattr(app.state, "dependency_index", None)
+    if index is None:
+        index = app.state.dependency_index = DependencyIndex(app)
+    return index
+
+
+def get_path_dependency(app: FastAPI = None, arg_name: str = None) -> Optional[Callable]:
+    """
+    Extract the first dependency of any kind taking the `arg_name` query parameter
     :param app:
-    :param field_name:
+    :param arg_name:
     :return:
     """
+    return dependency_index(app).get(arg_name)
 
-    for r in app.routes:
-        if hasattr(r, 'dependant') and r.dependant:
-            for d in r.dependant.dependencies:
-                if d.query_params:
-                    fields = [f.name for f in d.query_params]
-                    if arg_name in fields:
-                        fi = fields.index(arg_name)
-                        return r.dependant.dependencies[fi].call
-
-
-def replace_dependency(app=None, new_dependency=None, arg_name=None):
-    print('JUSSI')
-    depends = Depends(new_dependency)
-    for r in app.routes:
-        if hasattr(r, 'dependant') and r.dependant:
-            for d in r.dependant.dependencies:
-                if d.query_params:
-                    fields = [f.name for f in d.query_params]
-                    if arg_name in fields:
-                        #print(r.path)
-                        fi = fields.index(arg_name)
-                        old = r.dependant.dependencies.pop(fi)
-                        r.dependant.dependencies.insert(  # type: ignore
-                            fi,
-                            get_parameterless_sub_dependant(
-                                depends=depends, path=r.path_format  # type: ignore
-                            ),
-                        )
-                        r.dependencies.extend([depends])
\ No newline at end of file
+
+def replace_dependency(app: FastAPI = None, new_dependency: Callable = None, arg_name: str = None,
+                       old_dependency: Callable = None) -> int:
+    """
+    Replace `old_dependency` (by default the first dependency taking the `arg_name` query parameter) by
+    `new_dependency` in all the routes. The other dependencies taking `arg_name` (e.g. SignedDatasetPaths
+    next to SignedDatasetPath) are left as they are.
+    """
+    index = dependency_index(app)
+    old_dependency = old_dependency or index.get(arg_name)
+    if old_dependency is None:
+        raise ValueError(f"No route dependency takes the {arg_name!r} query parameter")
+    return index.replace({old_dependency: new_dependency})
@@ -0,0 +1,35 @@
+import numpy
+import pytest
+import rasterio
+from rasterio.transform import from_bounds
+
+from cogserver.extensions.materialize import materialize
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = str(tmp_path / "dataset.tif")
+    rng = numpy.random.default_rng(0)
+    rows, cols = numpy.mgrid[0:300, 0:260]
+    elevation = (numpy.sin(rows / 20) * numpy.cos(cols / 30) * 500 + 1000).astype("float32")
+    after = rng.integers(100, 4000, size=(300, 260)).astype("float32")
+    after[50:150, 60:200] = 20
+    with rasterio.open(
+        path, "w", driver="GTiff", width=260, height=300, count=2, dtype="float32", crs="EPSG:3857",
+        transform=from_bounds(0, 0, 26000, 30000, 260, 300), nodata=0,
+    ) as dst:
+        dst.write(numpy.stack([elevation, after]))
+    return path
+
+
+@pytest.mark.parametrize(
+    "algorithm, params",
+    [("hillshade", {"buffer": 3}), ("flood_detection", {})],
+)
+def test_chunked_output_matches_a_single_pass(tmp_path, dataset, algorithm, params):
+    single = materialize(dataset, algorithm, params, output=str(tmp_path / "single.tif"), chunk_size=1024)
+    # uneven chunks, more than two per thread
+    chunked = materialize(dataset, algorithm, params, output=str(tmp_path / "chunked.tif"), chunk_size=64, threads=2)
+    with rasterio.open(single) as a, rasterio.open(chunked) as b:
+        numpy.testing.assert_array_equal(a.read(), b.read())
+        numpy.testing.assert_array_equal(a.dataset_mask(), b.dataset_mask())
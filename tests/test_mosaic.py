@@ -0,0 +1,56 @@
+import time
+
+import numpy
+from rio_tiler.models import ImageData
+from rio_tiler.mosaic import mosaic_reader
+from rio_tiler.mosaic.methods.defaults import FirstMethod, HighestMethod
+
+from cogserver.mosaic import scheduled_mosaic_reader
+
+# every asset covers part of the tile, the first ones in mosaic order are the slowest to read
+ASSETS = {
+    "a": (slice(0, 4), 0.2),
+    "b": (slice(2, 8), 0.1),
+    "c": (slice(0, 8), 0.0),
+    "d": (slice(0, 8), 0.3),
+}
+
+
+def reader(asset, reads=None, **kwargs):
+    rows, delay = ASSETS[asset]
+    time.sleep(delay)
+    if reads is not None:
+        reads.append(asset)
+    data = numpy.full((1, 8, 8), ord(asset), dtype="uint8")
+    mask = numpy.ones((1, 8, 8), dtype=bool)
+    mask[:, rows] = False
+    return ImageData(numpy.ma.MaskedArray(data, mask=mask), bounds=(0, 0, 8, 8))
+
+
+def test_first_keeps_the_mosaic_order():
+    assets = list(ASSETS)
+    expected, _ = mosaic_reader(assets, reader, threads=1)
+    # c covers most of the tile and is read first, it completes before a and b
+    coverage = {"c": 4, "a": 1, "b": 1, "d": 4}
+    img, used = scheduled_mosaic_reader(assets, reader, coverage=coverage, threads=4)
+    numpy.testing.assert_array_equal(img.array.data, expected.array.data)
+    assert used == ["a", "b", "c"]
+    assert img.metadata["mosaic_method"] == "FirstMethod"
+    # d is cancelled (or its result dropped) once a, b and c have filled the tile
+    assert "d" not in used
+
+
+def test_other_methods_use_every_asset():
+    assets = list(ASSETS)
+    expected, _ = mosaic_reader(assets, reader, pixel_selection=HighestMethod(), threads=1)
+    img, used = scheduled_mosaic_reader(assets, reader, pixel_selection=HighestMethod(), threads=4)
+    numpy.testing.assert_array_equal(img.array.data, expected.array.data)
+    assert used == assets
+
+
+def test_first_stops_once_filled():
+    reads = []
+    img, used = scheduled_mosaic_reader(["c", "a", "b"], reader, pixel_selection=FirstMethod(), threads=1,
+                                        reads=reads)
+    assert used == ["c"] and reads == ["c"]
+    assert not numpy.ma.is_masked(img.array)
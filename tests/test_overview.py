@@ -0,0 +1,38 @@
+import numpy
+from rio_tiler.models import ImageData
+from titiler.core.algorithm.base import BaseAlgorithm
+
+from cogserver.algorithms import algorithms
+from cogserver.overview import downsample_factor, upsampled
+
+
+class Identity(BaseAlgorithm):
+    output_resampling: str = "bilinear"
+
+    def __call__(self, img: ImageData) -> ImageData:
+        return img
+
+
+def test_upsampled_to_the_tile_size_with_a_nearest_mask():
+    data = numpy.ma.MaskedArray(numpy.tile(numpy.arange(64, dtype="float32"), (1, 64, 1)))
+    data.mask = numpy.zeros(data.shape, dtype=bool)
+    data.mask[:, :, :30] = True
+    img = ImageData(data)
+
+    out = upsampled(Identity(), 256)(img)
+    assert out.array.shape == (1, 256, 256)
+    # the data is interpolated
+    assert len(numpy.unique(out.array.data)) > 64
+    mask = out.array.mask[0]
+    # nearest: the edge moves by whole pixels of the small image, no partially masked band
+    assert mask[:, :120].all() and not mask[:, 120:].any()
+
+
+def test_downsample_factor():
+    rca = algorithms.get("rca")()
+    flood = algorithms.get("flood_detection")()
+    assert downsample_factor(rca, 3) == 2
+    assert downsample_factor(flood, 3) == 8
+    assert downsample_factor(flood, 6) == 2
+    assert downsample_factor(flood, 7) == 1
+    assert downsample_factor(flood, None) == 1
@@ -0,0 +1,49 @@
+import numpy
+import pytest
+from pydantic import ValidationError
+from rio_tiler.models import ImageData
+
+from cogserver.algorithms import algorithms
+from cogserver.algorithms.pipeline import Pipeline
+
+
+def make_image():
+    rng = numpy.random.default_rng(0)
+    data = rng.integers(1, 4000, size=(4, 64, 64)).astype("uint16")
+    # a wet area on a noisy background
+    data[1, 10:40, 10:40] = 10
+    return ImageData(numpy.ma.MaskedArray(data, mask=numpy.zeros(data.shape, dtype=bool)))
+
+
+@pytest.mark.parametrize(
+    "steps, message",
+    [
+        ([], "at least one step"),
+        ([{"name": "nope"}], "Unknown algorithm"),
+        ([{"name": "binary_cleanup", "params": {"min_size": -1}}], "Invalid 'binary_cleanup' step parameters"),
+        ([{"name": "binary_cleanup"}, {"name": "rca"}], "needs 4 bands"),
+    ],
+)
+def test_plan_validation(steps, message):
+    with pytest.raises(ValidationError, match=message):
+        Pipeline(steps=steps)
+
+
+def test_plan_metadata():
+    flood_extent = algorithms.get("flood_extent")()
+    flood = algorithms.get("flood_detection")()
+    cleanup = algorithms.get("binary_cleanup")()
+    assert flood_extent.input_nbands == flood.input_nbands
+    assert flood_extent.output_nbands == cleanup.output_nbands
+    assert flood_extent.input_max_downsample == min(flood.input_max_downsample, cleanup.input_max_downsample)
+    assert flood_extent.output_resampling == "nearest"
+
+
+def test_pipeline_runs_the_steps_in_order():
+    img = make_image()
+    steps = [{"name": "flood_detection"}, {"name": "binary_cleanup", "params": {"min_size": 8}}]
+    out = Pipeline(steps=steps)(make_image())
+
+    expected = algorithms.get("binary_cleanup")(min_size=8)(algorithms.get("flood_detection")()(img))
+    numpy.testing.assert_array_equal(out.array.data, expected.array.data)
+    numpy.testing.assert_array_equal(numpy.ma.getmaskarray(out.array), numpy.ma.getmaskarray(expected.array))
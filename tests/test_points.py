@@ -0,0 +1,89 @@
+import base64
+import csv
+import io
+
+import numpy
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+from rasterio.transform import from_bounds
+
+from cogserver import app
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"dataset{i}.tif")
+        data = numpy.full((2, 10, 10), i + 1, dtype="float32")
+        data[:, 0, 0] = numpy.nan
+        with rasterio.open(
+            path, "w", driver="GTiff", width=10, height=10, count=2, dtype="float32", crs="EPSG:4326",
+            transform=from_bounds(0, 0, 10, 10, 10, 10),
+        ) as dst:
+            dst.write(data)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_points_json(client, datasets):
+    response = client.get("/cog/points", params={"url": datasets, "coord": ["5.5,5.5", "0.5,9.5", "20,20"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["coordinates"] == [[5.5, 5.5], [0.5, 9.5], [20, 20]]
+    results = sorted(body["results"], key=lambda r: r["index"])
+    for i, result in enumerate(results):
+        assert result["url"] == datasets[i]
+        assert result["band_names"] == ["b1", "b2"]
+        # a value, NaN as null, outside the dataset
+        assert result["values"] == [[i + 1.0, i + 1.0], [None, None], None]
+
+
+def test_points_csv(client, datasets):
+    response = client.get("/cog/points", params={"url": datasets[:1], "coord": ["5.5,5.5", "20,20"], "format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["index", "url", "lon", "lat", "band", "value", "error"]
+    assert rows[1:] == [
+        ["0", datasets[0], "5.5", "5.5", "b1", "1.0", ""],
+        ["0", datasets[0], "5.5", "5.5", "b2", "1.0", ""],
+        # outside the dataset
+        ["0", datasets[0], "20.0", "20.0", "b1", "", ""],
+    ]
+
+
+def test_unreadable_dataset_does_not_echo_the_token(client, datasets, tmp_path):
+    missing = str(tmp_path / "missing.tif")
+    token = base64.b64encode(b"sig=secret").decode()
+    params = {"url": [datasets[0], f"{missing}?{token}"], "coord": ["5.5,5.5"]}
+
+    results = sorted(client.get("/cog/points", params=params).json()["results"], key=lambda r: r["index"])
+    assert "values" in results[0]
+    assert results[1]["url"] == missing
+    assert results[1]["error"].endswith(f"could not read {missing}")
+    assert "values" not in results[1]
+
+    response = client.get("/cog/points", params={**params, "format": "csv"})
+    assert "secret" not in response.text
+    # rows are streamed as the datasets are read, not in request order
+    errors = {row[1]: row[-1] for row in list(csv.reader(io.StringIO(response.text)))[1:]}
+    assert errors[datasets[0]] == "" and errors[missing].endswith(f"could not read {missing}")
+
+
+def test_points_post(client, datasets):
+    response = client.post(
+        "/cog/points", json={"urls": datasets, "coordinates": [[5.5, 5.5]], "bidx": [2], "format": "json"}
+    )
+    assert response.status_code == 200
+    results = sorted(response.json()["results"], key=lambda r: r["index"])
+    assert [result["values"] for result in results] == [[[1.0]], [[2.0]]]
+
+
+def test_invalid_coordinate(client, datasets):
+    assert client.get("/cog/points", params={"url": datasets, "coord": ["5.5"]}).status_code == 400
@@ -0,0 +1,61 @@
+import numpy
+import rasterio
+from rasterio.transform import from_bounds
+
+from cogserver.archive import MBTilesArchive
+from cogserver.seed import seed
+
+
+def make_dataset(path: str):
+    # a small dataset in the north east of a larger seeded area, so some tiles are empty
+    with rasterio.open(
+        path, "w", driver="GTiff", width=64, height=64, count=1, dtype="uint8", crs="EPSG:4326",
+        transform=from_bounds(5, 5, 10, 10, 64, 64), nodata=0,
+    ) as dst:
+        dst.write(numpy.full((1, 64, 64), 100, dtype="uint8"))
+
+
+def test_seed_resumes_with_the_empty_tiles(tmp_path):
+    dataset = str(tmp_path / "dataset.tif")
+    output = str(tmp_path / "layer.mbtiles")
+    make_dataset(dataset)
+    options = {"url": dataset, "rescale": ["0,255"], "format": "png"}
+    bbox = (-20, -20, 10, 10)
+
+    first = seed(output, bbox, 0, 4, options, processes=1, batch_size=4)
+    assert first["rendered"] > 0 and first["empty"] > 0 and first["skipped"] == 0
+
+    with MBTilesArchive(output) as archive:
+        stored = sum(len(archive.existing(z)) for z in range(5))
+        assert stored == first["rendered"]
+        assert archive.metadata["format"] == "png"
+
+    second = seed(output, bbox, 0, 4, options, processes=1, batch_size=4)
+    assert second["rendered"] == 0
+    assert second["skipped"] == first["rendered"]
+
+
+def test_render_tile_matches_the_cog_tiles(tmp_path):
+    from fastapi.testclient import TestClient
+
+    from cogserver import app
+    from cogserver.seed import render_tile
+
+    dataset = str(tmp_path / "dataset.tif")
+    with rasterio.open(
+        dataset, "w", driver="GTiff", width=256, height=256, count=2, dtype="float32", crs="EPSG:4326",
+        transform=from_bounds(0, 0, 10, 10, 256, 256),
+    ) as dst:
+        green = numpy.linspace(0, 100, 256 * 256, dtype="float32").reshape(256, 256)
+        dst.write(numpy.stack([green, green.T]))
+    client = TestClient(app)
+
+    cases = [
+        # a low zoom algorithm tile, read downsampled from the overviews and upsampled
+        (3, 4, 3, "npy", {"algorithm": "flood_detection"}),
+        (6, 32, 31, "png", {"bidx": [1], "rescale": ["0,100"], "colormap_name": "viridis"}),
+    ]
+    for z, x, y, format, options in cases:
+        response = client.get(f"/cog/tiles/WebMercatorQuad/{z}/{x}/{y}.{format}", params={"url": dataset, **options})
+        assert response.status_code == 200
+        assert render_tile(z, x, y, {"url": dataset, "format": format, **options}) == response.content
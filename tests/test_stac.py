@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+
+import httpx
+import pytest
+
+from cogserver import stac
+from cogserver.stac import STACItemCache
+
+ITEM = {
+    "type": "Feature", "stac_version": "1.0.0", "id": "item", "bbox": [0, 0, 1, 1],
+    "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]},
+    "properties": {"datetime": "2020-01-01T00:00:00Z"}, "links": [],
+    "assets": {"data": {"href": "https://example.com/data.tif"}},
+}
+
+
+class FakeServer:
+    """httpx.get answering the item with an ETag, 304 to If-None-Match with the same ETag"""
+
+    def __init__(self, delay: float = 0):
+        self.etag = '"1"'
+        self.requests = []
+        self.delay = delay
+
+    def get(self, url, headers=None, **kwargs):
+        time.sleep(self.delay)
+        self.requests.append((url, dict(headers or {})))
+        request = httpx.Request("GET", url)
+        if (headers or {}).get("If-None-Match") == self.etag:
+            return httpx.Response(304, request=request)
+        return httpx.Response(200, json=ITEM, headers={"ETag": self.etag}, request=request)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(stac.httpx, "get", server.get)
+    return server
+
+
+def test_ttl_and_304_revalidation(server):
+    cache = STACItemCache(ttl=60)
+    url = "https://example.com/item.json"
+    first = cache.get(url)
+    assert cache.get(url) is first
+    assert len(server.requests) == 1
+
+    # expired: revalidated with the ETag, the 304 keeps the parsed item
+    first.checked -= 61
+    assert cache.get(url) is first
+    assert server.requests[-1][1]["If-None-Match"] == '"1"'
+    assert cache.stats()["revalidated"] == 1
+
+    # changed on the server: fetched again
+    first.checked -= 61
+    server.etag = '"2"'
+    assert cache.get(url) is not first
+    assert cache.stats()["fetched"] == 2
+
+
+def test_local_item_revalidated_with_its_modification_time(tmp_path):
+    path = str(tmp_path / "item.json")
+    with open(path, "w") as f:
+        json.dump(ITEM, f)
+    cache = STACItemCache(ttl=0)
+    first = cache.get(path)
+    assert cache.get(path) is first
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert cache.get(path) is not first
+
+
+def test_tokens_do_not_share_items(server):
+    cache = STACItemCache(ttl=60)
+    signed = cache.get("https://example.com/item.json?sig=secret")
+    unsigned = cache.get("https://example.com/item.json")
+    other = cache.get("https://example.com/item.json?sig=other")
+    assert len({id(signed), id(unsigned), id(other)}) == 3
+    assert [url for url, _ in server.requests] == [
+        "https://example.com/item.json?sig=secret",
+        "https://example.com/item.json",
+        "https://example.com/item.json?sig=other",
+    ]
+
+
+def test_concurrent_misses_fetch_once(server):
+    server.delay = 0.1
+    cache = STACItemCache(ttl=60)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("https://example.com/item.json")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(server.requests) == 1
+    assert len({id(result) for result in results}) == 1
+    assert not cache.fetching
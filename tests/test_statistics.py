@@ -0,0 +1,83 @@
+from xml.etree import ElementTree as ET
+
+import numpy
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+from rasterio.transform import from_bounds
+from rio_tiler.io import Reader
+
+from cogserver.statistics import (
+    STATISTICS_MAX_SIZE,
+    statistics_from_metadata,
+    statistics_metadata,
+    vrt_statistics,
+)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = str(tmp_path / "dataset.tif")
+    with rasterio.open(
+        path, "w", driver="GTiff", width=64, height=64, count=1, dtype="float32", crs="EPSG:4326",
+        transform=from_bounds(0, 0, 10, 10, 64, 64), nodata=-1,
+    ) as dst:
+        data = numpy.random.default_rng(0).normal(50, 10, (1, 64, 64)).astype("float32")
+        data[0, :8] = -1
+        dst.write(data)
+    return path
+
+
+def test_statistics_metadata_round_trip(dataset):
+    with Reader(dataset) as src:
+        stats = src.statistics(max_size=512, percentiles=[2, 98])["b1"]
+    tags = statistics_metadata(stats, 512)
+
+    assert statistics_from_metadata(tags, [2, 98], 10, 512).model_dump() == stats.model_dump()
+    # computed on another read size, with other percentiles or another number of bins
+    assert statistics_from_metadata(tags, [2, 98], 10, 1024) is None
+    assert statistics_from_metadata(tags, [5], 10, 512) is None
+    assert statistics_from_metadata(tags, [2, 98], 20, 512) is None
+
+
+def test_embedded_statistics_only_for_their_max_size(dataset, tmp_path, monkeypatch):
+    from cogserver import app
+
+    with rasterio.open(dataset) as src:
+        vrt = ET.fromstring(
+            f'<VRTDataset rasterXSize="64" rasterYSize="64"><SRS>{src.crs.to_wkt()}</SRS>'
+            f'<GeoTransform>{", ".join(map(str, src.transform.to_gdal()))}</GeoTransform>'
+            '<VRTRasterBand dataType="Float32" band="1"><NoDataValue>-1</NoDataValue><SimpleSource>'
+            f'<SourceFilename relativeToVRT="0">{dataset}</SourceFilename><SourceBand>1</SourceBand>'
+            '</SimpleSource></VRTRasterBand></VRTDataset>'
+        )
+    (stats,) = vrt_statistics(vrt)
+    metadata = ET.SubElement(vrt.find("VRTRasterBand"), "Metadata")
+    for key, value in statistics_metadata(stats).items():
+        ET.SubElement(metadata, "MDI", key=key).text = value
+    path = str(tmp_path / "dataset.vrt")
+    with open(path, "w") as f:
+        f.write(ET.tostring(vrt, encoding="unicode"))
+
+    previews = []
+    preview = Reader.preview
+
+    def spy(self, *args, **kwargs):
+        previews.append(kwargs.get("max_size"))
+        return preview(self, *args, **kwargs)
+
+    monkeypatch.setattr(Reader, "preview", spy)
+    client = TestClient(app)
+
+    response = client.get("/cog/statistics", params={"url": path})
+    assert response.status_code == 200
+    assert response.json()["b1"]["mean"] == pytest.approx(stats.mean)
+    assert previews == []
+
+    response = client.get("/cog/statistics", params={"url": path, "max_size": 512})
+    assert response.status_code == 200
+    assert previews == [512]
+
+    response = client.get("/cog/statistics", params={"url": path, "max_size": STATISTICS_MAX_SIZE})
+    assert response.status_code == 200
+    assert previews == [512]
@@ -0,0 +1,48 @@
+import json
+from xml.etree import ElementTree as ET
+
+import pytest
+from cogeo_mosaic.mosaic import MosaicJSON
+
+from cogserver import streaming
+from cogserver.streaming import ResponseCache, iter_element, iter_mosaicjson
+
+
+def make_mosaic(tiles):
+    return MosaicJSON(mosaicjson="0.0.3", minzoom=4, maxzoom=8, quadkey_zoom=6, bounds=(-10, -10, 10, 10),
+                      tiles=tiles)
+
+
+@pytest.mark.parametrize("count", [0, 1, 5])
+def test_iter_mosaicjson(count):
+    tiles = {f"03{i:04d}": [f"s3://bucket/{i}.tif", f"s3://bucket/{i}b.tif"] for i in range(count)}
+    mosaic = make_mosaic(tiles)
+    chunks = list(iter_mosaicjson(mosaic, quadkeys_per_chunk=2))
+    assert json.loads("".join(chunks)) == mosaic.model_dump(mode="json", exclude_none=True)
+    # header, one chunk per 2 quadkeys, closing braces
+    assert len(chunks) == 2 + (count + 1) // 2
+
+
+def test_iter_element():
+    vrt = ET.fromstring(
+        '<VRTDataset rasterXSize="10" rasterYSize="20">\n  <SRS dataAxisToSRSAxisMapping="1,2">GEOGCS["a &amp; b"]</SRS>'
+        '<VRTRasterBand dataType="Byte" band="1"><NoDataValue>0</NoDataValue></VRTRasterBand>\n</VRTDataset>'
+    )
+    vrt.set("note", 'quoted "value" <&>')
+    chunks = list(iter_element(vrt))
+    assert len(chunks) == 2 + 1 + len(vrt)
+    assert ET.canonicalize("".join(chunks)) == ET.canonicalize(ET.tostring(vrt, encoding="unicode"))
+
+
+def test_response_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(streaming.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(maxbytes=100, ttl=60)
+    cache.put("key", "application/json", "gzip", b"body")
+    now[0] += 59
+    assert cache.get("key") == ("application/json", "gzip", b"body")
+
+    # expired: dropped, the response is built again
+    now[0] += 1
+    assert cache.get("key") is None
+    assert cache.nbytes == 0 and not cache.entries
@@ -0,0 +1,65 @@
+from typing import Annotated, List
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, Query
+from fastapi.testclient import TestClient
+
+from cogserver.dependencies import SignedDatasetPath, SignedDatasetPaths
+from cogserver.util import dependency_index, get_path_dependency, replace_dependency
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    router = APIRouter()
+
+    @router.get("/info")
+    def info(src_path=Depends(SignedDatasetPath)):
+        return {"path": src_path}
+
+    @router.get("/build")
+    def build(urls=Depends(SignedDatasetPaths)):
+        return {"count": len(urls)}
+
+    app.include_router(router, prefix="/cog")
+    return app
+
+
+def NewPath(url: Annotated[str, Query(description="Dataset URL")]) -> str:
+    return f"new:{url}"
+
+
+def test_index_lookup():
+    app = make_app()
+    index = dependency_index(app)
+    assert get_path_dependency(app, "url") is SignedDatasetPath
+    assert len(index.calls[SignedDatasetPath]) == 1
+    assert len(index.calls[SignedDatasetPaths]) == 1
+    assert index.validate(lookups=1)["slots"] == 2
+
+
+def test_replace_keeps_the_list_dependency():
+    app = make_app()
+    client = TestClient(app)
+
+    assert replace_dependency(app, NewPath, "url") == 1
+    assert client.get("/cog/info", params={"url": "a.tif"}).json() == {"path": "new:a.tif"}
+    # the list-typed dependency also takes `url`, it is not replaced
+    assert client.get("/cog/build", params={"url": ["a.tif", "b.tif"]}).json() == {"count": 2}
+    assert dependency_index(app).calls.get(SignedDatasetPath) is None
+
+
+def test_replace_checks_the_signature():
+    app = make_app()
+    client = TestClient(app)
+
+    def ListPath(url: Annotated[List[str], Query()]) -> str:
+        return url
+
+    def Untyped(url: str):
+        return url
+
+    for dependency in (ListPath, Untyped):
+        with pytest.raises(ValueError):
+            dependency_index(app).replace({SignedDatasetPath: dependency})
+    # nothing changed
+    assert client.get("/cog/info", params={"url": "a.tif"}).json() == {"path": "a.tif"}
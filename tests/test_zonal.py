@@ -0,0 +1,132 @@
+import numpy
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+from rasterio.transform import from_bounds
+from rio_tiler.models import ImageData
+
+from cogserver.extensions.zonal import labelled_statistics, zonal_statistics, zone_layers
+
+
+def box(minx, miny, maxx, maxy):
+    return {"type": "Polygon", "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]]}
+
+
+def test_labelled_statistics():
+    rng = numpy.random.default_rng(0)
+    values = rng.normal(size=1000)
+    labels = rng.integers(0, 3, size=1000)
+    stats = labelled_statistics(values, labels, 4, [2, 98])
+    for label in range(3):
+        group = values[labels == label]
+        assert stats["count"][label] == len(group)
+        assert stats["min"][label] == group.min()
+        assert stats["max"][label] == group.max()
+        assert stats["mean"][label] == pytest.approx(group.mean())
+        assert stats["std"][label] == pytest.approx(group.std())
+        assert stats["median"][label] == pytest.approx(numpy.median(group))
+        assert stats["percentile_98"][label] == pytest.approx(numpy.percentile(group, 98))
+    # a label without values
+    assert stats["count"][3] == 0
+    assert numpy.isnan(stats["mean"][3]) and numpy.isnan(stats["percentile_2"][3])
+
+
+def test_overlapping_zones():
+    data = numpy.ma.MaskedArray(numpy.arange(100, dtype="float32").reshape(1, 10, 10), mask=False)
+    img = ImageData(data, bounds=(0, 0, 10, 10))
+    geometries = [box(0, 0, 6, 6), box(4, 4, 10, 10), box(0, 8, 2, 10), box(7, 0, 10, 2)]
+    layers = zone_layers(geometries, (10, 10), from_bounds(0, 0, 10, 10, 10, 10))
+    # the two overlapping zones are in different layers, all the others in the first one
+    assert sorted(map(sorted, layers)) == [[0, 2, 3], [1]]
+
+    stats = zonal_statistics(img, geometries, [50])
+    rows, cols = numpy.mgrid[0:10, 0:10]
+    for geometry, zone_stats in zip(geometries, stats):
+        minx, miny, maxx, maxy = geometry["coordinates"][0][0] + geometry["coordinates"][0][2]
+        inside = (cols >= minx) & (cols < maxx) & (10 - rows > miny) & (10 - rows <= maxy)
+        values = data.data[0][inside]
+        assert zone_stats["b1"]["count"] == len(values)
+        assert zone_stats["b1"]["mean"] == pytest.approx(values.mean())
+
+
+def test_null_geometry(tmp_path):
+    from cogserver import app
+
+    path = str(tmp_path / "dataset.tif")
+    with rasterio.open(
+        path, "w", driver="GTiff", width=10, height=10, count=1, dtype="float32", crs="EPSG:4326",
+        transform=from_bounds(0, 0, 10, 10, 10, 10),
+    ) as dst:
+        dst.write(numpy.ones((1, 10, 10), dtype="float32"))
+
+    features = [
+        {"type": "Feature", "properties": {"id": 1}, "geometry": None},
+        {"type": "Feature", "properties": {"id": 2}, "geometry": box(1, 1, 5, 5)},
+    ]
+    response = TestClient(app).post(
+        "/cog/zonal_statistics", params={"url": path}, json={"type": "FeatureCollection", "features": features}
+    )
+    assert response.status_code == 200
+    first, second = response.json()["features"]
+    assert "statistics" not in first["properties"]
+    assert second["properties"]["statistics"]["b1"]["count"] == 16
+
+
+def make_strip(path: str, width: int):
+    with rasterio.open(
+        path, "w", driver="GTiff", width=width, height=4, count=1, dtype="uint8", crs="EPSG:3857",
+        transform=from_bounds(0, 0, width, 4, width, 4), tiled=True, blockxsize=256, blockysize=16,
+    ) as dst:
+        dst.write(numpy.ones((1, 4, width), dtype="uint8"))
+
+
+def test_bounded_read_size(tmp_path):
+    from cogserver import app
+
+    path = str(tmp_path / "strip.tif")
+    make_strip(path, 6000)
+    collection = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": box(0, 0, 6000, 4)},
+    ]}
+    client = TestClient(app)
+
+    def count(**params):
+        response = client.post(
+            "/cog/zonal_statistics", params={"url": path, "coord_crs": "EPSG:3857", **params}, json=collection
+        )
+        assert response.status_code == 200
+        return response.json()["features"][0]["properties"]["statistics"]["b1"]["count"]
+
+    # read at most ZONAL_MAX_SIZE pixels wide by default
+    assert count() < 6000 * 4
+    assert count(max_size=6000) == 6000 * 4
+
+
+def test_failed_window_only_fails_its_zones(tmp_path, monkeypatch):
+    from cogserver import app
+    from cogserver.extensions import zonal
+
+    path = str(tmp_path / "strip.tif")
+    make_strip(path, 4096)
+    features = [
+        {"type": "Feature", "properties": {"id": 1}, "geometry": box(0, 0, 100, 4)},
+        {"type": "Feature", "properties": {"id": 2}, "geometry": box(3000, 0, 3100, 4)},
+    ]
+
+    def failing(img, geometries, percentiles):
+        # the window of the second block
+        if img.bounds[0] >= 2048:
+            raise RuntimeError("/vsicurl/https://host/data.tif?sig=secret")
+        return zonal_statistics(img, geometries, percentiles)
+
+    monkeypatch.setattr(zonal, "zonal_statistics", failing)
+    response = TestClient(app).post(
+        "/cog/zonal_statistics", params={"url": path, "coord_crs": "EPSG:3857"},
+        json={"type": "FeatureCollection", "features": features},
+    )
+    assert response.status_code == 200
+    assert "secret" not in response.text
+    first, second = response.json()["features"]
+    assert first["properties"]["statistics"]["b1"]["count"] == 400
+    assert "statistics" not in second["properties"]
+    assert second["properties"]["error"] == "RuntimeError: could not read the zone"